@@ -0,0 +1,40 @@
+import argparse
+import os
+import tempfile
+import time
+
+from bench.synthetic import write_amex_pdf
+from parser import amex
+
+
+def _time_mode(input_file: str, mode: str, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        amex.extract_data(input_file, mode)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Compares the table and text extraction modes of the Amex parser')
+    p.add_argument('--pages', type=int, nargs='+', default=[1, 5, 20], help='Statement sizes in pages')
+    p.add_argument('--rows-per-page', type=int, default=40)
+    p.add_argument('--repeat', type=int, default=3, help='Runs per measurement, the best one is kept')
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        print(f'{"pages":>6} {"rows":>6} {"tables (s)":>11} {"text (s)":>9} {"speedup":>8}  same rows')
+        for pages in args.pages:
+            input_file = os.path.join(folder, f'amex_{pages}.pdf')
+            write_amex_pdf(input_file, pages * args.rows_per_page, args.rows_per_page, seed=pages)
+
+            tables = _time_mode(input_file, 'tables', args.repeat)
+            text = _time_mode(input_file, 'text', args.repeat)
+            same = amex.extract_data(input_file, 'tables') == amex.extract_data(input_file, 'text')
+            try:
+                amex.extract_data(input_file, 'check')
+            except ValueError:
+                same = False
+
+            print(f'{pages:>6} {pages * args.rows_per_page:>6} {tables:>11.3f} {text:>9.3f} {tables / text:>7.1f}x  {same}')
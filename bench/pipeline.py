@@ -0,0 +1,184 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from bench import stubs, synthetic
+from category.llm import LlmClassifier
+from category.local import LocalClassifier
+from category.store import CategoryStore
+from currency.bacen import ExchangeRateBacen
+from currency.converter import ConverterSelector
+from currency.ecb import REFERENCE_CURRENCIES, ExchangeRateECB
+from currency.http import HttpFetcher
+from currency.store import RateStore
+from main import build_classifier, categorize_transactions, cents_fields, convert_transactions, get_files, scan_transactions
+from parser import registry
+from storage.output import CsvOutput
+from storage.transfers import TransferIndex
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+_CSV_WRITERS = {
+    'commerzbank': synthetic.write_commerzbank_csv,
+    'inter': synthetic.write_inter_csv,
+    'lufthansa': synthetic.write_lufthansa_csv,
+    'n26': synthetic.write_n26_csv,
+}
+
+
+def write_statements(folder: str, rows: int, pdf_pages: int, rows_per_page: int = 40) -> None:
+    '''Writes one synthetic statement of each format to the folder'''
+    for i, (name, write) in enumerate(_CSV_WRITERS.items()):
+        write(os.path.join(folder, f'{name}.csv'), rows, seed=i)
+    if pdf_pages > 0:
+        synthetic.write_amex_pdf(os.path.join(folder, 'amex.pdf'), pdf_pages * rows_per_page, rows_per_page)
+
+
+class Stages:
+    '''Runs the stages one after the other, recording their time, rows/s and peak memory.
+    With trace_memory the peak of memory allocated by the stage is measured, which slows it down,
+    so times are only meaningful from a run without it.'''
+
+    def __init__(self, trace_memory: bool) -> None:
+        self.trace_memory = trace_memory
+        self.results: Dict[str, Dict] = {}
+
+    def run(self, name: str, stage: Callable[[], Any], count: Callable[[Any], int] = len) -> Any:
+        '''Runs stage and returns its result; count gives the number of rows it handled from the result'''
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            result = stage()
+        finally:
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if self.trace_memory else None
+            if self.trace_memory:
+                tracemalloc.stop()
+
+        entry = self.results.setdefault(name, {'seconds': 0.0, 'rows': 0, 'peak_bytes': None})
+        entry['seconds'] += seconds
+        entry['rows'] += count(result)
+        if peak is not None:
+            entry['peak_bytes'] = max(entry['peak_bytes'] or 0, peak)
+        return result
+
+
+def run_pipeline(folder: str, work_dir: str, rates_url: str, openai_url: str, trace_memory: bool) -> Dict[str, Dict]:
+    '''Runs every stage of main.py on the statements of the folder, with all state kept in work_dir'''
+    from openai import OpenAI
+
+    stages = Stages(trace_memory)
+
+    files = stages.run('get_files', lambda: get_files(folder), lambda found: sum(len(f) for f in found.values()))
+
+    transactions = []
+    for extension, files_by_extension in files.items():
+        for file in files_by_extension:
+            file_format = registry.detect(file, extension)
+            parser = registry.get_parser(file_format)
+            transactions += stages.run(f'extract_data[{file_format.name}]', lambda: parser.extract_data(file))
+
+    def rows_count(_) -> int:
+        return len(transactions)
+
+    min_date, max_date, currencies = stages.run('scan_transactions', lambda: scan_transactions(transactions), rows_count)
+
+    # Rows of this stage are the days of the rate tables
+    def fetch_rates() -> Tuple[ConverterSelector, int]:
+        store = RateStore(os.path.join(work_dir, 'rates.sqlite'))
+        fetcher = HttpFetcher()
+        ecb_currencies = sorted(({'USD'} | currencies) & set(REFERENCE_CURRENCIES) - {'BRL'})
+        ecb = ExchangeRateECB(min_date, max_date, store, fetcher, base_url=rates_url + '/ecb/', currencies=ecb_currencies)
+        bacen = ExchangeRateBacen(min_date, max_date, store, fetcher, base_url=rates_url + '/bacen')
+        tables = [ecb.rate_table(c) for c in ecb.currencies] + [bacen.rate_table(c) for c in bacen.currencies]
+        return ConverterSelector(bacen, ecb), sum(len(t) for t in tables)
+    converter, _ = stages.run('fetch_rates', fetch_rates, lambda result: result[1])
+
+    converted = stages.run('convert', lambda: convert_transactions(transactions, converter), rows_count)
+
+    def categorize() -> List[Optional[str]]:
+        category_store = CategoryStore(os.path.join(work_dir, 'categories.sqlite'))
+        local_classifier = LocalClassifier(os.path.join(work_dir, 'local_model.json.gz'))
+        llm_classifier = LlmClassifier(client=OpenAI(base_url=openai_url + '/v1', api_key='bench'))
+        return categorize_transactions(transactions, category_store, build_classifier(local_classifier, llm_classifier))
+    categories = stages.run('categorize', categorize)
+
+    rows = []
+    for i, t in enumerate(transactions):
+        amounts = {field: converted.columns[currency][i] for currency, field in cents_fields.items() if t.cents(currency) is None}
+        rows.append((t._replace(**amounts), categories[i]))
+
+    def link_transfers() -> List[Tuple]:
+        transfers = TransferIndex(os.path.join(work_dir, 'transfers.sqlite'))
+        linked, _ = transfers.link(rows)
+        transfers.close()
+        return linked
+    rows = stages.run('link_transfers', link_transfers)
+
+    def write() -> None:
+        output = CsvOutput(os.path.join(work_dir, 'output.csv'), appending=False)
+        output.write(rows)
+        output.close()
+    stages.run('write_csv', write, lambda _: len(rows))
+
+    return stages.results
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Measures the throughput and peak memory of each stage on synthetic statements')
+    p.add_argument('--rows', type=int, default=10000, help='Rows of each csv statement')
+    p.add_argument('--pdf-pages', type=int, default=5, help='Pages of the Amex statement, 0 for none')
+    p.add_argument('--json', type=str, default='bench_pipeline.json', help='File the results are saved to')
+    args = p.parse_args()
+
+    # Rows skipped by the parsers log a warning each
+    logging.disable(logging.WARNING)
+
+    rates_server = stubs.start_rates_server()
+    openai_server = stubs.start_openai_server()
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            statements = os.path.join(folder, 'statements')
+            os.makedirs(statements)
+            write_statements(statements, args.rows, args.pdf_pages)
+
+            # Every run starts from empty caches, so both do the same work
+            timed = run_pipeline(statements, os.path.join(folder, 'timed'), rates_server.url, openai_server.url, False)
+            traced = run_pipeline(statements, os.path.join(folder, 'traced'), rates_server.url, openai_server.url, True)
+    finally:
+        rates_server.close()
+        openai_server.close()
+
+    stages = {}
+    print(f'{"stage":<28} {"rows":>8} {"seconds":>9} {"rows/s":>11} {"peak MiB":>9}')
+    for name, result in timed.items():
+        rows_per_second = result['rows'] / result['seconds'] if result['seconds'] > 0 else None
+        stages[name] = {**result, 'rows_per_second': rows_per_second, 'peak_bytes': traced[name]['peak_bytes']}
+        print(f'{name:<28} {result["rows"]:>8} {result["seconds"]:>9.4f} {rows_per_second or 0:>11.0f} '
+              f'{traced[name]["peak_bytes"] / 2 ** 20:>9.2f}')
+
+    report = {
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'rows_per_csv': args.rows,
+        'pdf_pages': args.pdf_pages,
+        'requests': {'rates': rates_server.requests, 'openai': openai_server.requests},
+        'stages': stages,
+    }
+    with open(args.json, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Saved to {args.json}')
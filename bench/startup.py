@@ -0,0 +1,78 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench import synthetic
+from parser import registry
+from storage.ledger import IngestionLedger
+from storage.output import CsvOutput
+from typing import List, Set, Tuple
+
+
+_MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+
+# Modules whose import dominates the startup time when they are loaded
+_HEAVY_MODULES = ('pdfplumber', 'pypdfium2', 'openai', 'requests', 'dotenv')
+
+
+def prepare_ingested_folder(folder: str, rows: int) -> Tuple[str, str]:
+    '''Writes csv statements that are already recorded as ingested, like a cron run with nothing new.
+    Returns the statements folder and the state dir.'''
+    statements = os.path.join(folder, 'statements')
+    state_dir = os.path.join(folder, 'state')
+    os.makedirs(statements)
+    synthetic.write_commerzbank_csv(os.path.join(statements, 'commerzbank.csv'), rows)
+    synthetic.write_n26_csv(os.path.join(statements, 'n26.csv'), rows)
+
+    ledger = IngestionLedger(os.path.join(state_dir, 'ledger.json'))
+    for file in sorted(os.listdir(statements)):
+        file = os.path.join(statements, file)
+        file_id = registry.get_parser(registry.detect(file, '.csv')).extract_file(file)[0]
+        ledger.record(file_id, file, rows)
+    ledger.save()
+    CsvOutput(os.path.join(folder, 'output.csv'), appending=False).close()
+    return statements, state_dir
+
+
+def _time_command(command: List[str], cwd: str, repeat: int) -> float:
+    '''Returns the median wall time of the command'''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=cwd, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def _heavy_imports(command: List[str], cwd: str) -> Set[str]:
+    '''Returns the heavy modules the command imports, from the report of python -X importtime'''
+    result = subprocess.run([command[0], '-X', 'importtime'] + command[1:], cwd=cwd, check=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    imported = {line.rsplit('|', 1)[-1].strip() for line in result.stderr.splitlines() if line.startswith('import time:')}
+    return {module for module in _HEAVY_MODULES if module in imported}
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Measures how long main.py takes to start and finish when there is nothing to do')
+    p.add_argument('--main', type=str, default=_MAIN, help='main.py to measure, e.g. from another checkout to compare')
+    p.add_argument('--repeat', type=int, default=10, help='Runs per measurement, the median is kept')
+    p.add_argument('--rows', type=int, default=1000, help='Rows of each already ingested csv statement')
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        statements, state_dir = prepare_ingested_folder(folder, args.rows)
+        scenarios = [
+            ('python -c pass', [sys.executable, '-c', 'pass']),
+            ('--help', [sys.executable, args.main, '--help']),
+            ('nothing new', [sys.executable, args.main, statements, '--state-dir', state_dir, '--offline']),
+        ]
+
+        print(f'{"scenario":<16} {"median (ms)":>12}  heavy modules imported')
+        for name, command in scenarios:
+            seconds = _time_command(command, folder, args.repeat)
+            heavy = _heavy_imports(command, folder)
+            print(f'{name:<16} {seconds * 1000:>12.1f}  {", ".join(sorted(heavy)) or "-"}')
@@ -0,0 +1,121 @@
+import json
+import re
+import threading
+
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, Type
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+# Rates served for every weekday, per currency
+_ECB_RATES = {'USD': 1.08, 'BRL': 5.42, 'GBP': 0.85, 'CHF': 0.95}
+_BACEN_RATES = {'USD': 5.01, 'EUR': 5.43}
+
+_BACEN_PARAMETERS = re.compile(r"@moeda='(\w+)'.*@dataInicial='([\d-]+)'.*@dataFinalCotacao='([\d-]+)'")
+
+
+def _weekdays(start: date, end: date) -> Iterator[date]:
+    day = start
+    while day <= end:
+        if day.weekday() < 5:
+            yield day
+        day += timedelta(days=1)
+
+
+def _bacen_date(text: str) -> date:
+    month, day, year = text.split('-')
+    return date(int(year), int(month), int(day))
+
+
+class StubServer:
+    '''Serves a handler on a free local port from a background thread, counting the requests'''
+
+    def __init__(self, handler: Type[BaseHTTPRequestHandler]) -> None:
+        self.requests = 0
+        self.bytes_sent = 0
+        server = self
+
+        class CountingHandler(handler):
+            def log_message(self, format, *args) -> None:
+                pass
+
+            def _send(self, status: int, content_type: str, body: bytes) -> None:
+                server.requests += 1
+                server.bytes_sent += len(body)
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), CountingHandler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self._server.server_port}'
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class RatesHandler(BaseHTTPRequestHandler):
+    '''Answers like the ECB data API under /ecb/ and like the Bacen PTAX API under /bacen'''
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        if url.path.startswith('/ecb/'):
+            query = parse_qs(url.query)
+            start = date.fromisoformat(query['startPeriod'][0])
+            end = date.fromisoformat(query['endPeriod'][0])
+            lines = ['KEY,FREQ,CURRENCY,CURRENCY_DENOM,EXR_TYPE,EXR_SUFFIX,TIME_PERIOD,OBS_VALUE']
+            currencies = [c for c in url.path.split('/')[-1].split('.')[1].split('+') if c in _ECB_RATES]
+            for currency in currencies:
+                lines += [f'EXR.D.{currency}.EUR.SP00.A,D,{currency},EUR,SP00,A,{day},{_ECB_RATES[currency]}'
+                          for day in _weekdays(start, end)]
+            if len(lines) == 1:
+                self._send(404, 'text/plain', b'No results have been found for the query.')
+            else:
+                self._send(200, 'text/csv', '\n'.join(lines).encode())
+        elif url.path.startswith('/bacen'):
+            match = _BACEN_PARAMETERS.search(unquote(url.query))
+            currency = match.group(1)
+            values = [{'cotacaoCompra': _BACEN_RATES[currency], 'dataHoraCotacao': f'{day} 13:08:00.000'}
+                      for day in _weekdays(_bacen_date(match.group(2)), _bacen_date(match.group(3)))]
+            self._send(200, 'application/json', json.dumps({'value': values}).encode())
+        else:
+            self._send(404, 'text/plain', b'')
+
+
+class OpenAIHandler(BaseHTTPRequestHandler):
+    '''Answers chat completions like the model, with a category picked from each description'''
+
+    def do_POST(self) -> None:
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        content = request['messages'][-1]['content']
+        answer = []
+        for line in content.splitlines():
+            line_id, _, description = line.partition(',')
+            answer.append(f'{line_id},{"Groceries" if len(description) % 2 == 0 else "Shopping"}')
+        body = {
+            'id': 'chatcmpl-stub',
+            'object': 'chat.completion',
+            'created': 0,
+            'model': request['model'],
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': '\n'.join(answer)}}],
+            'usage': {'prompt_tokens': len(content) // 4, 'completion_tokens': 3 * len(answer),
+                      'total_tokens': len(content) // 4 + 3 * len(answer)},
+        }
+        self._send(200, 'application/json', json.dumps(body).encode())
+
+
+def start_rates_server() -> StubServer:
+    return StubServer(RatesHandler)
+
+
+def start_openai_server() -> StubServer:
+    return StubServer(OpenAIHandler)
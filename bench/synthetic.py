@@ -0,0 +1,153 @@
+import random
+
+from typing import List
+
+
+_PAGE_WIDTH = 595
+_PAGE_HEIGHT = 842
+_ROW_HEIGHT = 16
+
+
+def _escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _amex_header(card_number: int) -> List[str]:
+    '''First lines of an Amex statement, laid out where parser.amex looks for them'''
+    lines = ['American Express Europe S.A. (Germany branch)']
+    lines += [f'Header line {i}' for i in range(1, 7)]
+    lines += [f'Kartennummer xxxx-xxxxxx-{card_number:05d} 25.01.24']
+    lines += [f'Information line {i}' for i in range(8, 18)]
+    lines += ['Abrechnungszeitraum vom 26.12.23bis 25.01.24']
+    return lines
+
+
+def _amex_rows(count: int, rnd: random.Random) -> List[str]:
+    rows = []
+    for _ in range(count):
+        month = rnd.choice(['12', '01'])
+        day = rnd.randint(1, 28)
+        merchant = rnd.choice(['AMAZON', 'LIDL', 'SHELL', 'LUFTHANSA', 'NETFLIX', 'IKEA'])
+        rows.append(f'{day:02d}.{month} {day:02d}.{month} {merchant} {rnd.randint(1, 999)} BERLIN {rnd.randint(1, 999)},{rnd.randint(0, 99):02d}')
+    return rows
+
+
+def _page_content(header: List[str], rows: List[str]) -> str:
+    '''Draws the header lines as text and the rows as a one column table with ruling lines'''
+    operations = []
+    y = _PAGE_HEIGHT - 42
+    for line in header:
+        operations.append(f'BT /F1 9 Tf 1 0 0 1 40 {y} Tm ({_escape(line)}) Tj ET')
+        y -= 14
+    top = y - 10
+
+    for i, row in enumerate(rows):
+        operations.append(f'BT /F1 9 Tf 1 0 0 1 45 {top - (i + 1) * _ROW_HEIGHT + 5} Tm ({_escape(row)}) Tj ET')
+
+    operations.append('0.5 w')
+    if len(rows) > 0:
+        bottom = top - len(rows) * _ROW_HEIGHT
+        for i in range(len(rows) + 1):
+            y = top - i * _ROW_HEIGHT
+            operations.append(f'40 {y} m 560 {y} l S')
+        operations.append(f'40 {top} m 40 {bottom} l S')
+        operations.append(f'560 {top} m 560 {bottom} l S')
+    return '\n'.join(operations)
+
+
+def write_amex_pdf(path: str, rows: int, rows_per_page: int = 40, seed: int = 0) -> None:
+    '''Writes an Amex-like statement that parser.amex can read, with the given number of transaction rows'''
+    rnd = random.Random(seed)
+    transaction_rows = _amex_rows(rows, rnd)
+    pages = [transaction_rows[i:i + rows_per_page] for i in range(0, len(transaction_rows), rows_per_page)] or [[]]
+    contents = [_page_content(_amex_header(seed % 100000) if i == 0 else [], page) for i, page in enumerate(pages)]
+
+    kids = ' '.join(f'{4 + 2 * i} 0 R' for i in range(len(contents)))
+    objects = [
+        '<< /Type /Catalog /Pages 2 0 R >>',
+        f'<< /Type /Pages /Kids [{kids}] /Count {len(contents)} >>',
+        '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    for i, content in enumerate(contents):
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {_PAGE_WIDTH} {_PAGE_HEIGHT}] '
+                       f'/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>')
+        objects.append(f'<< /Length {len(content.encode("latin-1"))} >>\nstream\n{content}\nendstream')
+
+    data = b'%PDF-1.4\n'
+    offsets = []
+    for i, obj in enumerate(objects):
+        offsets.append(len(data))
+        data += f'{i + 1} 0 obj\n{obj}\nendobj\n'.encode('latin-1')
+    xref_offset = len(data)
+    data += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    data += b''.join(f'{offset:010d} 00000 n \n'.encode() for offset in offsets)
+    data += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n'.encode()
+
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+_MERCHANTS = ['REWE MARKT', 'EDEKA', 'LIDL', 'DM DROGERIE', 'DB VERTRIEB', 'BVG', 'AMAZON MKTPLACE', 'NETFLIX',
+              'SPOTIFY', 'STARBUCKS', 'SHELL', 'IKEA', 'ZALANDO', 'APOTHEKE', 'VODAFONE']
+
+
+def _merchant(rnd: random.Random) -> str:
+    return f'{rnd.choice(_MERCHANTS)} {rnd.randint(1, 50)} {rnd.choice(["BERLIN", "POTSDAM", "SAO PAULO"])}'
+
+
+def _de_amount(rnd: random.Random, maximum: int) -> str:
+    '''An amount written as 1.234,56'''
+    return f'{rnd.randint(0, maximum):,}'.replace(',', '.') + f',{rnd.randint(0, 99):02d}'
+
+
+def _foreign(rnd: random.Random) -> str:
+    return rnd.choice(['', '', 'USD', 'BRL', 'GBP', 'CHF'])
+
+
+def write_commerzbank_csv(path: str, rows: int, seed: int = 0) -> None:
+    '''Writes a Commerzbank-like account export that parser.commerzbank can read'''
+    rnd = random.Random(seed)
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        f.write('Buchungstag;Wertstellung;Umsatzart;Buchungstext;Betrag;Währung;IBAN Kontoinhaber;Kategorie\n')
+        for _ in range(rows):
+            day = f'{rnd.randint(1, 28):02d}.{rnd.randint(1, 12):02d}.2024'
+            f.write(f'{day};{day};Lastschrift;{_merchant(rnd)};-{_de_amount(rnd, 2000)};EUR;DE00123;Sonstiges\n')
+
+
+def write_inter_csv(path: str, rows: int, seed: int = 0) -> None:
+    '''Writes a Banco Inter-like account export that parser.inter can read'''
+    rnd = random.Random(seed)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write('Extrato Conta Corrente \nConta ;1234567\nPeríodo ;01/01/2024 a 31/12/2024\nSaldo ;1.000,00\n\n')
+        f.write('Data Lançamento;Descrição;Valor;Saldo\n')
+        for _ in range(rows):
+            f.write(f'{rnd.randint(1, 28):02d}/{rnd.randint(1, 12):02d}/2024;Pix enviado: "{_merchant(rnd)}";'
+                    f'-{_de_amount(rnd, 5000)};{_de_amount(rnd, 9000)}\n')
+
+
+def write_lufthansa_csv(path: str, rows: int, seed: int = 0) -> None:
+    '''Writes a Miles & More credit card export that parser.lufthansa can read'''
+    rnd = random.Random(seed)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write('Miles & More Gold Credit Card;5310XXXXXXXX1234\n\n')
+        f.write('Authorised on;Processed on;Status;Description;Amount;Currency;Amount in foreign currency;Exchange rate;Currency\n')
+        for _ in range(rows):
+            currency = _foreign(rnd)
+            foreign_amount = f'-{_de_amount(rnd, 900)}' if currency else ''
+            status = 'Authorised' if rnd.random() < 0.05 else 'Processed'
+            f.write(f'{rnd.randint(1, 28):02d}.{rnd.randint(1, 12):02d}.2024;01.01.2024;{status};{_merchant(rnd)};'
+                    f'-{_de_amount(rnd, 900)};EUR;{foreign_amount};1,0;{currency}\n')
+
+
+def write_n26_csv(path: str, rows: int, seed: int = 0) -> None:
+    '''Writes an N26 account export that parser.n26 can read'''
+    rnd = random.Random(seed)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write('"Booking Date","Value Date","Partner Name","Partner Iban",Type,"Payment Reference","Account Name",'
+                '"Amount (EUR)","Original Amount","Original Currency","Exchange Rate"\n')
+        for _ in range(rows):
+            day = f'2024-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}'
+            currency = _foreign(rnd)
+            original_amount = f'{rnd.randint(1, 900)}.{rnd.randint(0, 99):02d}' if currency else ''
+            f.write(f'{day},{day},"{_merchant(rnd)}",,Presentment,,Main Account,-{rnd.randint(1, 900)}.{rnd.randint(0, 99):02d},'
+                    f'{original_amount},{currency},\n')
@@ -0,0 +1,102 @@
+import argparse
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from bench import stubs
+from bench.pipeline import _CSV_WRITERS
+from currency.bacen import ExchangeRateBacen
+from currency.ecb import ExchangeRateECB
+from currency.http import HttpFetcher
+from currency.store import RateStore
+from datetime import date
+from parser import registry
+from typing import List
+
+
+_MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+
+
+def fill_rate_cache(cache_dir: str) -> None:
+    '''Caches the rates of the synthetic statements, so the watched run needs no network'''
+    server = stubs.start_rates_server()
+    fetcher = HttpFetcher()
+    try:
+        store = RateStore.in_cache_dir(cache_dir)
+        start, end = date(2023, 12, 1), date(2024, 12, 31)
+        ecb = ExchangeRateECB(start, end, store, fetcher, base_url=server.url + '/ecb/', currencies=('CHF', 'GBP', 'USD'))
+        bacen = ExchangeRateBacen(start, end, store, fetcher, base_url=server.url + '/bacen')
+        ecb.rate_table('USD')
+        bacen.rate_table('USD')
+        store.close()
+    finally:
+        fetcher.close()
+        server.close()
+
+
+def _count_rows(path: str) -> int:
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'rb') as f:
+        return max(sum(1 for _ in f) - 1, 0)
+
+
+def drop_statement(folder: str, staging: str, name: str, rows: int, seed: int) -> int:
+    '''Writes a statement outside the folder and moves it in at once, like a finished download.
+    Returns the number of transactions it holds.'''
+    staged = os.path.join(staging, name)
+    _CSV_WRITERS[name.split('_')[0]](staged, rows, seed=seed)
+    count = len(registry.get_parser(registry.detect(staged, '.csv')).extract_data(staged))
+    os.replace(staged, os.path.join(folder, name))
+    return count
+
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser(description='Measures the time from a statement dropped in a watched folder to its rows in the output')
+    p.add_argument('--main', type=str, default=_MAIN, help='main.py to measure')
+    p.add_argument('--files', type=int, default=8, help='Statements dropped one after the other')
+    p.add_argument('--rows', type=int, default=500, help='Rows of each csv statement')
+    p.add_argument('--timeout', type=float, default=30, help='Seconds to wait for the rows of a statement')
+    args = p.parse_args()
+
+    # Rows skipped by the parsers log a warning each
+    logging.disable(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as folder:
+        statements = os.path.join(folder, 'statements')
+        staging = os.path.join(folder, 'staging')
+        os.makedirs(statements)
+        os.makedirs(staging)
+        output = os.path.join(folder, 'output.csv')
+        fill_rate_cache(os.path.join(folder, 'cache'))
+
+        command = [sys.executable, args.main, statements, '--watch', '--offline', '--output', output,
+                   '--cache-dir', os.path.join(folder, 'cache'), '--state-dir', os.path.join(folder, 'state')]
+        service = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+                                   env={**os.environ, 'PYTHONUNBUFFERED': '1'})
+        try:
+            print(service.stdout.readline().strip())
+            # Keep reading what the service prints, so it never blocks on a full pipe
+            threading.Thread(target=service.stdout.read, daemon=True).start()
+            latencies: List[float] = []
+            expected = _count_rows(output)
+            for i in range(args.files):
+                name = f'{list(_CSV_WRITERS)[i % len(_CSV_WRITERS)]}_{i}.csv'
+                expected += drop_statement(statements, staging, name, args.rows, seed=i)
+                start = time.perf_counter()
+                while _count_rows(output) < expected:
+                    if time.perf_counter() - start > args.timeout:
+                        raise TimeoutError(f'The rows of {name} did not reach the output')
+                    time.sleep(0.005)
+                latencies.append(time.perf_counter() - start)
+                print(f'{name:<20} {latencies[-1] * 1000:>8.1f} ms')
+        finally:
+            service.terminate()
+            service.wait()
+
+    print(f'median {statistics.median(latencies) * 1000:.1f} ms, max {max(latencies) * 1000:.1f} ms')
@@ -0,0 +1,144 @@
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from profiling.metrics import metrics
+from typing import Dict, List, Optional, Tuple
+
+
+_SYSTEM_PROMPT = "You are responsible for classifying transactions based on their description. Consider that I live in Potsdam/Germany but I might also have expenses in Brazil. The input will contain the transaction id and the transaction description separated by comma. For each input line, give as output the transaction id and the category separated by comma without anything else so I can parse it on my system. These are the possible categories:Salary,Contract Work,Investment Income,Rental Income,Other Income,Rent,Utilities,Insurance,Subscriptions,Groceries,Eating Out,Transportation,Healthcare,Subscriptions,Entertainment,Shopping,Education,Travel,Investment,Donations,Gifts,Fees and Charges,Transfers Between Accounts,Other Expenses"
+
+CATEGORIES = (
+    'Salary', 'Contract Work', 'Investment Income', 'Rental Income', 'Other Income', 'Rent', 'Utilities',
+    'Insurance', 'Subscriptions', 'Groceries', 'Eating Out', 'Transportation', 'Healthcare', 'Entertainment',
+    'Shopping', 'Education', 'Travel', 'Investment', 'Donations', 'Gifts', 'Fees and Charges',
+    'Transfers Between Accounts', 'Other Expenses',
+)
+
+_CATEGORIES_BY_NAME = {c.casefold(): c for c in CATEGORIES}
+
+
+def _estimate_tokens(text: str) -> int:
+    # Roughly four characters per token, plus the separators of the line
+    return len(text) // 4 + 3
+
+
+class LlmClassifier:
+    '''Classifies descriptions with the OpenAI chat completions API.
+    Descriptions are deduplicated and split into batches that fit a token budget. Batches run
+    concurrently, and the lines the model left out or answered with something unparsable are
+    sent again in retry batches.'''
+
+    def __init__(self, client=None, model: str = 'gpt-4o', max_batch_tokens: int = 2000,
+                 max_batch_lines: int = 100, max_in_flight: int = 4, max_attempts: int = 3) -> None:
+        self._client = client
+        self.model = model
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_lines = max_batch_lines
+        self.max_in_flight = max_in_flight
+        self.max_attempts = max_attempts
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.invalid_lines = 0
+        # Batches run on the workers of a thread pool, which all update the counters
+        self._counters_lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            from dotenv import load_dotenv
+            from openai import OpenAI
+
+            load_dotenv()
+            self._client = OpenAI()
+        return self._client
+
+    def preload(self) -> None:
+        '''Imports the OpenAI library ahead of the first request. The client is not created,
+        since that needs credentials a run with every description cached never uses.'''
+        import dotenv
+        import openai
+
+    def _batches(self, items: List[Tuple[int, str]]) -> List[List[Tuple[int, str]]]:
+        batches = []
+        batch = []
+        tokens = 0
+        for item in items:
+            item_tokens = _estimate_tokens(item[1])
+            if len(batch) > 0 and (tokens + item_tokens > self.max_batch_tokens or len(batch) >= self.max_batch_lines):
+                batches.append(batch)
+                batch = []
+                tokens = 0
+            batch.append(item)
+            tokens += item_tokens
+        if len(batch) > 0:
+            batches.append(batch)
+        return batches
+
+    def _parse(self, content: str, batch: List[Tuple[int, str]]) -> Dict[int, str]:
+        '''Returns the valid categories of the answer, keyed by the index of the description'''
+        categories = {}
+        for line in content.splitlines():
+            if line.strip() == '':
+                continue
+            line_id, _, category = line.partition(',')
+            category = _CATEGORIES_BY_NAME.get(category.strip().casefold())
+            try:
+                line_id = int(line_id.strip())
+            except ValueError:
+                line_id = None
+            if category is None or line_id is None or not 0 <= line_id < len(batch):
+                with self._counters_lock:
+                    self.invalid_lines += 1
+                metrics.add('llm.invalid_lines')
+                continue
+            categories[batch[line_id][0]] = category
+        return categories
+
+    def _classify_batch(self, batch: List[Tuple[int, str]]) -> Dict[int, str]:
+        # Each batch numbers its lines from zero, which keeps the prompt and the answer short
+        lines = "\n".join(str(i) + "," + description for i, (_, description) in enumerate(batch))
+        try:
+            with metrics.timer('llm.request'):
+                chat_completion = self.client.chat.completions.create(
+                    messages=[
+                        {"role": "system", "content": _SYSTEM_PROMPT},
+                        {"role": "user", "content": lines},
+                    ],
+                    model=self.model
+                )
+        except Exception as e:
+            logging.warning(f'Could not classify a batch of {len(batch)} descriptions: {e}')
+            metrics.add('llm.failed_requests')
+            return {}
+
+        with self._counters_lock:
+            self.requests += 1
+            if chat_completion.usage is not None:
+                self.prompt_tokens += chat_completion.usage.prompt_tokens
+                self.completion_tokens += chat_completion.usage.completion_tokens
+                metrics.add('llm.prompt_tokens', chat_completion.usage.prompt_tokens)
+                metrics.add('llm.completion_tokens', chat_completion.usage.completion_tokens)
+        return self._parse(chat_completion.choices[0].message.content or '', batch)
+
+    def classify(self, descriptions: List[str]) -> List[Optional[str]]:
+        '''Returns the category of each description, or None when the model never gave a valid one'''
+        unique = list(dict.fromkeys(descriptions))
+        pending = list(enumerate(unique))
+        categories: Dict[int, str] = {}
+
+        for _ in range(self.max_attempts):
+            if len(pending) == 0:
+                break
+            batches = self._batches(pending)
+            with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+                for found in pool.map(self._classify_batch, batches):
+                    categories.update(found)
+            pending = [item for item in pending if item[0] not in categories]
+
+        if len(pending) > 0:
+            logging.warning(f'Could not classify {len(pending)} descriptions')
+
+        by_description = {unique[i]: category for i, category in categories.items()}
+        return [by_description.get(d) for d in descriptions]
@@ -0,0 +1,266 @@
+import csv
+import gzip
+import json
+import math
+import os
+import sqlite3
+
+from .store import normalize_description
+from collections import Counter, defaultdict
+from profiling.metrics import metrics
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+
+# Number of most similar known descriptions that vote for the category
+_NEIGHBOURS = 5
+
+# Features of more descriptions than this share of the model, and than _MIN_COMMON, are stop-trigrams:
+# their posting lists are too long to walk for every prediction
+_COMMON_SHARE = 0.01
+_MIN_COMMON = 200
+
+# Descriptions found through the rare features whose similarity is computed with the stop-trigrams too
+_CANDIDATES = 50
+
+# The weights of the index are computed again once the model grew by this share since they were
+_REWEIGHT_GROWTH = 0.25
+
+
+def _features(normalized: str) -> List[str]:
+    '''Words and character trigrams of the words, so merchants are recognised with small spelling changes'''
+    features = set()
+    for word in normalized.split(' '):
+        if word == '' or word == '#':
+            continue
+        features.add('w:' + word)
+        padded = ' ' + word + ' '
+        for i in range(len(padded) - 2):
+            features.add(padded[i:i + 3])
+    return list(features)
+
+
+def _categorized_rows(file: str) -> Iterator[Tuple[str, str]]:
+    '''Yields the description and category of the rows of an output, either a csv file or a SQLite database'''
+    with open(file, 'rb') as f:
+        is_sqlite = f.read(16) == b'SQLite format 3\x00'
+
+    if is_sqlite:
+        connection = sqlite3.connect(file)
+        try:
+            yield from connection.execute('SELECT description, category FROM transactions WHERE category IS NOT NULL')
+        finally:
+            connection.close()
+        return
+
+    with open(file, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            yield row['description'], row.get('category') or ''
+
+
+def _most_voted(votes: Dict[str, int]) -> str:
+    '''The category with most votes, the first one seen among ties'''
+    return max(votes, key=votes.get)
+
+
+def _file_stats(files: Iterable[str]) -> Dict[str, List[float]]:
+    stats = {}
+    for file in files:
+        if os.path.exists(file):
+            stat = os.stat(file)
+            stats[os.path.abspath(file)] = [stat.st_size, stat.st_mtime]
+    return stats
+
+
+class LocalClassifier:
+    '''Nearest neighbour classifier over the descriptions of previous outputs, without any network access.
+    Descriptions are compared by the cosine similarity of their TF-IDF weighted words and trigrams.
+    The votes for the category of each description and the files they came from are persisted,
+    and the inverted index is rebuilt on load. Rows appended to the output are learnt as they are
+    written, so the output is only read again when it was changed some other way.
+
+    New descriptions are appended to the inverted index as they are learnt. The IDF weights and the
+    norms of the descriptions are only computed again when the model grew by _REWEIGHT_GROWTH,
+    new descriptions being weighted with the IDF known until then.'''
+
+    def __init__(self, path: str, min_confidence: float = 0.5) -> None:
+        self.path = path
+        self.min_confidence = min_confidence
+        self.examples: Dict[str, str] = {}
+        self.votes: Dict[str, Dict[str, int]] = {}
+        self.trained_on: Dict[str, List[float]] = {}
+        self.accepted = 0
+        self.escalated = 0
+        self._build_index()
+
+    @classmethod
+    def in_state_dir(cls, state_dir: str, min_confidence: float = 0.5) -> 'LocalClassifier':
+        return cls.load(os.path.join(state_dir, 'local_model.json.gz'), min_confidence)
+
+    @classmethod
+    def load(cls, path: str, min_confidence: float = 0.5) -> 'LocalClassifier':
+        classifier = cls(path, min_confidence)
+        if os.path.exists(path):
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                content = json.load(f)
+            if 'votes' in content:
+                classifier.votes = content['votes']
+                classifier.trained_on = content['trained_on']
+            else:
+                # Models saved without their votes are trained again from the files
+                classifier.votes = {description: {category: 1} for description, category in content['examples'].items()}
+            classifier.examples = {description: _most_voted(votes) for description, votes in classifier.votes.items()}
+            classifier._build_index()
+        return classifier
+
+    def save(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_path = self.path + '.tmp'
+        with gzip.open(temporary_path, 'wt', encoding='utf-8') as f:
+            json.dump({'votes': self.votes, 'trained_on': self.trained_on}, f, separators=(',', ':'))
+        os.replace(temporary_path, self.path)
+
+    def _build_index(self) -> None:
+        # Position of each description in the index, with its category and features
+        self._positions: Dict[str, int] = {}
+        self._categories: List[str] = []
+        self._documents: List[Set[str]] = []
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        self._frequencies: Counter = Counter()
+        self._norms: List[float] = []
+        for description, category in self.examples.items():
+            self._index(description, category)
+        self._reweight()
+
+    def _index(self, description: str, category: str) -> None:
+        '''Adds a description to the index, or updates its category when it is there already'''
+        position = self._positions.get(description)
+        if position is not None:
+            self._categories[position] = category
+            return
+
+        position = self._positions[description] = len(self._documents)
+        features = _features(description)
+        self._categories.append(category)
+        self._documents.append(set(features))
+        for feature in features:
+            self._postings[feature].append(position)
+        self._frequencies.update(features)
+
+    def _weight(self, feature: str) -> float:
+        idf = self._idf.get(feature)
+        if idf is None:
+            # A feature new since the weights were computed
+            idf = math.log((1 + self._weighted_count) / (1 + self._frequencies[feature])) + 1
+        return idf
+
+    def _norm(self, features: Iterable[str]) -> float:
+        return math.sqrt(sum(self._weight(f) ** 2 for f in features)) or 1.0
+
+    def _reweight(self) -> None:
+        '''Computes the IDF of every feature and the norm of every description'''
+        count = self._weighted_count = len(self._documents)
+        self._idf = {feature: math.log((1 + count) / (1 + frequency)) + 1 for feature, frequency in self._frequencies.items()}
+        self._norms = [self._norm(features) for features in self._documents]
+
+    def is_current(self, files: Iterable[str]) -> bool:
+        '''Tells whether the model was trained on exactly these files, as they are now'''
+        return _file_stats(files) == self.trained_on
+
+    def mark_trained(self, files: Iterable[str]) -> None:
+        '''Records the files as they are now as the ones the model knows, once the rows written to them were learnt'''
+        self.trained_on = _file_stats(files)
+
+    def train(self, files: Iterable[str]) -> int:
+        '''Replaces the examples with the categorized rows of the output files and returns their number.
+        A description found with several categories keeps the most frequent one.'''
+        files = [file for file in files if os.path.exists(file)]
+        self.votes = {}
+        self.examples = {}
+        self._build_index()
+        for file in files:
+            self.learn(_categorized_rows(file))
+        self.mark_trained(files)
+        self._reweight()
+        return len(self.examples)
+
+    def learn(self, rows: Iterable[Tuple[str, Optional[str]]]) -> None:
+        '''Adds the votes of the description and category of rows written to the output'''
+        for description, category in rows:
+            category = (category or '').strip()
+            if not category:
+                continue
+            normalized = normalize_description(description)
+            votes = self.votes.setdefault(normalized, {})
+            votes[category] = votes.get(category, 0) + 1
+            self.examples[normalized] = _most_voted(votes)
+            self._index(normalized, self.examples[normalized])
+        if len(self._documents) > self._weighted_count * (1 + _REWEIGHT_GROWTH):
+            self._reweight()
+        else:
+            self._norms += [self._norm(features) for features in self._documents[len(self._norms):]]
+
+    def predict(self, descriptions: List[str]) -> List[Tuple[Optional[str], float]]:
+        '''Returns the most likely category of each description and a confidence between 0 and 1.
+        The confidence is the similarity of the closest neighbour of that category, scaled by its share
+        of the votes of the neighbours.
+
+        Neighbours are looked for among the descriptions sharing a rare feature with the description,
+        the stop-trigrams being left out unless there is no other. The similarity of the _CANDIDATES closest
+        through the rare features is then completed with the stop-trigrams.'''
+        frequencies = self._frequencies
+        common = max(_MIN_COMMON, len(self._documents) * _COMMON_SHARE)
+        predictions = []
+        for description in descriptions:
+            features = [f for f in _features(normalize_description(description)) if frequencies[f] > 0]
+            if len(features) == 0:
+                predictions.append((None, 0.0))
+                continue
+
+            weights = {f: self._weight(f) for f in features}
+            norm = math.sqrt(sum(w ** 2 for w in weights.values()))
+            rare = [f for f in features if frequencies[f] <= common] or [min(features, key=frequencies.get)]
+            dot_products: Dict[int, float] = defaultdict(float)
+            for feature in rare:
+                weight = weights[feature] ** 2 / norm
+                for i in self._postings[feature]:
+                    dot_products[i] += weight
+
+            norms = self._norms
+            candidates = sorted(dot_products, key=lambda i: dot_products[i] / norms[i], reverse=True)[:_CANDIDATES]
+            stop_trigrams = [(f, weights[f] ** 2 / norm) for f in features if f not in rare]
+            scores = []
+            for i in candidates:
+                document = self._documents[i]
+                dot_product = dot_products[i] + sum(weight for f, weight in stop_trigrams if f in document)
+                scores.append((i, dot_product / norms[i]))
+
+            neighbours = sorted(scores, key=lambda item: item[1], reverse=True)[:_NEIGHBOURS]
+            votes: Dict[str, float] = defaultdict(float)
+            closest: Dict[str, float] = {}
+            for i, score in neighbours:
+                category = self._categories[i]
+                votes[category] += score
+                closest.setdefault(category, score)
+
+            category = max(votes, key=votes.get)
+            confidence = closest[category] * votes[category] / sum(votes.values())
+            predictions.append((category, min(confidence, 1.0)))
+        return predictions
+
+    def classify(self, descriptions: List[str], fallback=None) -> List[Optional[str]]:
+        '''Returns the category of each description predicted with enough confidence.
+        The other descriptions are given to fallback, or left without a category when there is none.'''
+        with metrics.timer('categorize.local'):
+            predictions = self.predict(descriptions)
+        categories: List[Optional[str]] = [c if confidence >= self.min_confidence else None for c, confidence in predictions]
+
+        uncertain = [i for i, c in enumerate(categories) if c is None]
+        self.accepted += len(categories) - len(uncertain)
+        # Counted with or without a fallback: offline they are the rows left without a category
+        self.escalated += len(uncertain)
+        if fallback is not None and len(uncertain) > 0:
+            for i, category in zip(uncertain, fallback([descriptions[i] for i in uncertain])):
+                categories[i] = category
+        return categories
@@ -0,0 +1,107 @@
+import csv
+import re
+
+from storage.sqlite_state import SqliteState
+from typing import Callable, Dict, List, Optional
+
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS categories (
+    description TEXT PRIMARY KEY,
+    category TEXT NOT NULL,
+    manual INTEGER NOT NULL DEFAULT 0
+);
+'''
+
+_DIGITS = re.compile(r'\d+')
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_description(description: str) -> str:
+    '''Reduces a description to the part that identifies the merchant.
+    Case, spacing and numbers (store numbers, references, dates) are ignored.'''
+    description = _DIGITS.sub('#', description.casefold())
+    return _SPACES.sub(' ', description).strip()
+
+
+class CategoryStore(SqliteState):
+    '''Categories already given to each normalized description, persisted in SQLite.
+    Manual corrections take precedence over the model and are never overwritten by it.
+    Categories read once are kept in memory, so a long running process only queries new descriptions.'''
+
+    FILE_NAME = 'categories.sqlite'
+    SCHEMA = _SCHEMA
+
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+        self._cache: Dict[str, str] = {}
+        self.hits = 0
+        self.misses = 0
+        self.classified = 0
+
+    def _lookup(self, keys: List[str]) -> Dict[str, str]:
+        found = {key: self._cache[key] for key in keys if key in self._cache}
+        missing = [key for key in keys if key not in found]
+        # Stay below SQLite's limit of variables per statement
+        for start in range(0, len(missing), 500):
+            batch = missing[start:start + 500]
+            cursor = self._connection.execute(
+                f'SELECT description, category FROM categories WHERE description IN ({",".join("?" * len(batch))})', batch)
+            found.update(cursor.fetchall())
+        self._cache.update(found)
+        return found
+
+    def set_model_categories(self, categories: Dict[str, str]) -> None:
+        '''Stores categories given by the model, keeping manual corrections'''
+        rows = [(normalize_description(d), c) for d, c in categories.items()]
+        with self._connection:
+            self._connection.executemany(
+                'INSERT INTO categories (description, category, manual) VALUES (?, ?, 0) '
+                'ON CONFLICT (description) DO UPDATE SET category = excluded.category WHERE manual = 0',
+                rows)
+        # Whether a manual correction was kept is only known to the database
+        for key, _ in rows:
+            self._cache.pop(key, None)
+
+    def set_manual_category(self, description: str, category: str) -> None:
+        key = normalize_description(description)
+        with self._connection:
+            self._connection.execute(
+                'INSERT INTO categories (description, category, manual) VALUES (?, ?, 1) '
+                'ON CONFLICT (description) DO UPDATE SET category = excluded.category, manual = 1',
+                (key, category))
+        self._cache[key] = category
+
+    def import_corrections(self, corrections_file: str) -> int:
+        '''Imports manual corrections from a csv file with description and category columns'''
+        count = 0
+        with open(corrections_file, 'r', encoding='utf-8-sig') as f:
+            for row in csv.DictReader(f):
+                self.set_manual_category(row['description'], row['category'].strip())
+                count += 1
+        return count
+
+    def categorize(self, descriptions: List[str], classify: Callable[[List[str]], List[Optional[str]]]) -> List[Optional[str]]:
+        '''Returns the category of each description.
+        Only the descriptions never seen before are given to classify, once per normalized description.'''
+        keys = [normalize_description(d) for d in descriptions]
+        known = self._lookup(sorted(set(keys)))
+
+        unknown = {}
+        for key, description in zip(keys, descriptions):
+            if key not in known and key not in unknown:
+                unknown[key] = description
+
+        hits = sum(1 for key in keys if key in known)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        self.classified += len(unknown)
+
+        if len(unknown) > 0:
+            unknown_descriptions = list(unknown.values())
+            classified = classify(unknown_descriptions)
+            new_categories = {d: c for d, c in zip(unknown_descriptions, classified) if c}
+            self.set_model_categories(new_categories)
+            known.update((normalize_description(d), c) for d, c in new_categories.items())
+
+        return [known.get(key) for key in keys]
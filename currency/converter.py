@@ -1,26 +1,114 @@
-from .bacen import ExchangeRateBacen
-from .ecb import ExchangeRateECB
-
+from .rate_table import RateTable, cross_rates
 from datetime import date
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# The providers pull in the HTTP stack, which the command line only loads once rates are needed
+if TYPE_CHECKING:
+    from .bacen import ExchangeRateBacen
+    from .ecb import ExchangeRateECB
+
+
+class ConvertedColumns:
+    '''Result of a batch conversion: one column of amounts in cents per target currency.
+    Rows that could not be converted are flagged in the failed mask and explained in errors.'''
+
+    def __init__(self, size: int, currencies: Sequence[str]) -> None:
+        self.columns: Dict[str, List[Optional[int]]] = {c: [None] * size for c in currencies}
+        self.failed: Dict[str, List[bool]] = {c: [False] * size for c in currencies}
+        self.errors: Dict[str, Dict[int, str]] = {c: {} for c in currencies}
+
+    def _fail(self, rows: Sequence[int], currency: str, error: str) -> None:
+        for i in rows:
+            self.failed[currency][i] = True
+            self.errors[currency][i] = error
 
 
 class ConverterSelector:
-    def __init__(self, bacen: ExchangeRateBacen, ecb: ExchangeRateECB):
+    '''Converts between any two currencies the providers know, through rates precomputed per day.
+    Pairs are triangulated through EUR with the ECB reference rates, except legs into or out of BRL,
+    for which the Bacen PTAX rates are authoritative: a currency Bacen does not quote crosses through
+    its EUR rate. The rate table of each pair is built once, so a conversion is a single lookup.'''
+
+    def __init__(self, bacen: 'ExchangeRateBacen', ecb: 'ExchangeRateECB'):
         self.bacen = bacen
         self.ecb = ecb
+        self._pair_tables: Dict[Tuple[str, str], RateTable] = {}
+
+    def _eur_rate(self, currency: str) -> Optional[RateTable]:
+        '''Units of the currency per EUR, None for EUR itself'''
+        return None if currency == 'EUR' else self.ecb.rate_table(currency)
+
+    def _brl_rate(self, currency: str) -> Tuple[Optional[RateTable], Optional[RateTable]]:
+        '''BRL per unit of the currency, as a numerator and denominator to cross'''
+        if currency in self.bacen.currencies:
+            return self.bacen.rate_table(currency), None
+        return self.bacen.rate_table('EUR'), self._eur_rate(currency)
 
-    def convert(self, date: date, amount: float, from_currency: str, to_currency: str) -> float:
-        if from_currency == 'BRL':
-            converter = self.bacen
-        elif from_currency == 'EUR':
-            converter = self.ecb
-        elif from_currency == 'USD':
-            if to_currency == 'EUR':
-                converter = self.ecb
+    def pair_table(self, from_currency: str, to_currency: str) -> RateTable:
+        '''Returns the table of the rates that amounts in from_currency are multiplied by'''
+        pair = (from_currency, to_currency)
+        table = self._pair_tables.get(pair)
+        if table is None:
+            if from_currency == to_currency:
+                raise ValueError('Nothing to convert between the same currency')
+            if to_currency == 'BRL':
+                numerator, denominator = self._brl_rate(from_currency)
+            elif from_currency == 'BRL':
+                denominator, numerator = self._brl_rate(to_currency)
             else:
-                converter = self.bacen
-        
-        if converter is None:
-            raise ValueError('Unsupported conversion')
-        
-        return round(converter.convert(date, amount, from_currency, to_currency), 2)
+                numerator, denominator = self._eur_rate(to_currency), self._eur_rate(from_currency)
+            table = cross_rates(numerator, denominator)
+            self._pair_tables[pair] = table
+        return table
+
+    def prepare(self, from_currencies: Iterable[str], to_currencies: Iterable[str] = ('EUR', 'USD', 'BRL')) -> None:
+        '''Builds the pair tables a conversion will need ahead of it, waiting for the rates.
+        Pairs that cannot be built are left for convert_many to report on the rows they concern.'''
+        for from_currency in from_currencies:
+            for to_currency in to_currencies:
+                if from_currency != to_currency:
+                    try:
+                        self.pair_table(from_currency, to_currency)
+                    except Exception:
+                        continue
+
+    def convert(self, date: date, cents: int, from_currency: str, to_currency: str) -> int:
+        '''Converts one amount in cents, rounded to the cent exactly like convert_many'''
+        if from_currency == to_currency:
+            return cents
+        return round(cents * self.pair_table(from_currency, to_currency).lookup(date))
+
+    def convert_many(self, dates: Sequence[date], amounts: Sequence[int], from_currencies: Sequence[str],
+                     to_currencies: Sequence[str] = ('EUR', 'USD', 'BRL')) -> ConvertedColumns:
+        '''Converts whole columns of amounts in cents to each of the target currencies, rounded to the cent.
+        Rows are grouped by currency pair so every pair table is looked up once per group.
+        Amounts already in a target currency are copied.'''
+        result = ConvertedColumns(len(dates), to_currencies)
+        ordinals = [d.toordinal() for d in dates]
+
+        rows_by_currency: Dict[str, List[int]] = {}
+        for i, currency in enumerate(from_currencies):
+            rows_by_currency.setdefault(currency, []).append(i)
+
+        for from_currency, rows in rows_by_currency.items():
+            for to_currency in to_currencies:
+                column = result.columns[to_currency]
+                if from_currency == to_currency:
+                    for i in rows:
+                        column[i] = amounts[i]
+                    continue
+
+                try:
+                    rate_table = self.pair_table(from_currency, to_currency)
+                except Exception as e:
+                    result._fail(rows, to_currency, f'{from_currency} to {to_currency}: {e}')
+                    continue
+
+                rates, missing = rate_table.lookup_many([ordinals[i] for i in rows])
+                for i, rate, no_rate in zip(rows, rates, missing):
+                    if no_rate:
+                        result._fail([i], to_currency, rate_table.missing_rate_message(dates[i]))
+                    else:
+                        column[i] = round(amounts[i] * rate)
+
+        return result
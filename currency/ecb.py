@@ -1,84 +1,73 @@
 import requests
 
-from datetime import date, datetime, timedelta
+from .http import HttpFetcher
+from .provider import RateProvider
+from .store import RateStore
+from datetime import date
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
 
 
 _DATE_FORMAT = '%Y-%m-%d'
 
-class ExchangeRateECB:
-    def __init__(self, start_date: date, end_date: date) -> None:
-        self.start_date = start_date - timedelta(days=5)
-        self.end_date = end_date
-        self.rate_usd = {}
-        self.rate_brl = {}
-        self._BASE_URL = 'https://data-api.ecb.europa.eu/service/'
+# Currencies of the euro foreign exchange reference rates published daily by the ECB
+REFERENCE_CURRENCIES = (
+    'AUD', 'BGN', 'BRL', 'CAD', 'CHF', 'CNY', 'CZK', 'DKK', 'GBP', 'HKD', 'HUF', 'IDR', 'ILS', 'INR', 'ISK',
+    'JPY', 'KRW', 'MXN', 'MYR', 'NOK', 'NZD', 'PHP', 'PLN', 'RON', 'SEK', 'SGD', 'THB', 'TRY', 'USD', 'ZAR',
+)
+
+class ExchangeRateECB(RateProvider):
+    '''Euro reference rates, in units of the currency per euro.
+    All the currencies are fetched with a single multi-key request, e.g. D.USD+GBP.EUR.SP00.A.'''
+
+    PROVIDER = 'ecb'
+    CURRENCIES = ('USD', 'BRL')
+    MULTI_CURRENCY = True
+
+    def __init__(self, start_date: date, end_date: date, store: Optional[RateStore] = None,
+                 fetcher: Optional[HttpFetcher] = None, base_url: str = 'https://data-api.ecb.europa.eu/service/',
+                 currencies: Optional[Iterable[str]] = None) -> None:
+        super().__init__(start_date, end_date, store, fetcher, currencies)
+        self._BASE_URL = base_url
         self._RESOURCE = 'data'
         self._FLOW_REF = 'EXR'
 
-    def _fetch_rates(self) -> None:
-        base_url = 'https://data-api.ecb.europa.eu/service/'
-        resource = 'data'
-        flow_ref = 'EXR'
-        key_usd = 'D.USD.EUR.SP00.A'
-        key_brl = 'D.BRL.EUR.SP00.A'
+    def _pair(self, currency: str) -> str:
+        return f'EUR/{currency}'
 
-        url_usd = f'{base_url}{resource}/{flow_ref}/{key_usd}'
-        url_brl = f'{base_url}{resource}/{flow_ref}/{key_brl}'
+    def _request(self, currencies: Sequence[str], start_date: date, end_date: date) -> Tuple[str, Any]:
+        key = f'D.{"+".join(currencies)}.EUR.SP00.A'
+        url = f'{self._BASE_URL}{self._RESOURCE}/{self._FLOW_REF}/{key}'
 
         parameters = {
-            'startPeriod': self.start_date.strftime(_DATE_FORMAT),
-            'endPeriod': self.end_date.strftime(_DATE_FORMAT),
+            'startPeriod': start_date.strftime(_DATE_FORMAT),
+            'endPeriod': end_date.strftime(_DATE_FORMAT),
             'format': 'csvdata'
         }
+        return url, parameters
 
-        try:
-            response_usd = requests.get(url_usd, params=parameters)
-            response_brl = requests.get(url_brl, params=parameters)
-        except requests.exceptions.RequestException as e:
-            raise e
+    def _parse(self, response: requests.Response, currencies: Sequence[str]) -> Dict[str, Dict[str, float]]:
+        rates: Dict[str, Dict[str, float]] = {currency: {} for currency in currencies}
+        # The API answers 404 when there are no rates in the period, e.g. over a weekend
+        if response.status_code == 404:
+            return rates
+        response.raise_for_status()
 
+        CURRENCY_COLUMN_INDEX = 2
         DATE_COLUMN_INDEX = 6
         RATE_COLUMN_INDEX = 7
-        for line in response_usd.text.splitlines()[1:]:
+        for line in response.text.splitlines()[1:]:
             columns = line.split(',')
+            currency = columns[CURRENCY_COLUMN_INDEX]
             date = columns[DATE_COLUMN_INDEX]
             rate = columns[RATE_COLUMN_INDEX]
-            self.rate_usd[date] = float(rate)
-
-        for line in response_brl.text.splitlines()[1:]:
-            columns = line.split(',')
-            date = columns[DATE_COLUMN_INDEX] 
-            rate = columns[RATE_COLUMN_INDEX]
-            self.rate_brl[date] = float(rate)
-
+            # Days the rate was not published can come without a value
+            if currency in rates and rate != '':
+                rates[currency][date] = float(rate)
+        return rates
 
     def convert(self, date: date, amount: float, currency_from: str, currency_to: str) -> float:
-        if currency_from != 'EUR' and currency_to != 'EUR':
-            raise ValueError('One of the currencies must be EUR')
-
-        if len(self.rate_usd) == 0 or len(self.rate_brl) == 0:
-            self._fetch_rates()
-        
-        if currency_from == 'USD' or currency_to == 'USD':
-            rate_map = self.rate_usd
-        elif currency_from == 'BRL' or currency_to == 'BRL':
-            rate_map = self.rate_brl
-        else:
-            raise ValueError('Currency not supported')
-        
-        # Find the closest date
-        for d in rate_map.keys():
-            if datetime.strptime(d, _DATE_FORMAT).date() > date:
-                break
-            else:
-                conversion_date = d
-        
-        if conversion_date is None:
-            raise ValueError('No rate found for the givena date')
-        
-        rate_on_date = rate_map[conversion_date]
         if currency_from == 'EUR':
-            return amount * rate_on_date
-        else:
-            return amount / rate_on_date
-        
\ No newline at end of file
+            return amount * self.rate_table(currency_to).lookup(date)
+        if currency_to == 'EUR':
+            return amount / self.rate_table(currency_from).lookup(date)
+        raise ValueError('One of the currencies must be EUR')
@@ -0,0 +1,70 @@
+import requests
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from profiling.metrics import metrics
+from typing import Any, Callable, List, Optional, Tuple
+from urllib.parse import urlparse
+from urllib3.util.retry import Retry
+
+
+_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class HttpFetcher:
+    '''Shared HTTP layer for the rate providers.
+    Requests go through one pooled keep-alive session with a timeout and bounded retries,
+    and batches of requests are sent concurrently.'''
+
+    def __init__(self, timeout: float = 15.0, retries: int = 3, max_workers: int = 8) -> None:
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=_RETRY_STATUSES, allowed_methods=('GET',))
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # Requests and background jobs use separate pools, so a background job
+        # waiting on its requests can never starve them of workers.
+        self._requests = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='http')
+        self._jobs = ThreadPoolExecutor(max_workers=2, thread_name_prefix='prefetch')
+
+    def get(self, url: str, params: Any = None) -> requests.Response:
+        if not metrics.enabled:
+            return self.session.get(url, params=params, timeout=self.timeout)
+
+        start = time.perf_counter()
+        response = self.session.get(url, params=params, timeout=self.timeout)
+        host = urlparse(url).netloc
+        metrics.record(f'http.{host}', time.perf_counter() - start)
+        metrics.add(f'http.{host}.bytes', len(response.content))
+        metrics.add(f'http.{host}.status_{response.status_code}')
+        return response
+
+    def get_many(self, requests_to_send: List[Tuple[str, Any]]) -> List[requests.Response]:
+        '''Sends the (url, params) requests concurrently and returns the responses in the same order'''
+        if len(requests_to_send) == 1:
+            return [self.get(*requests_to_send[0])]
+        futures = [self._requests.submit(self.get, url, params) for url, params in requests_to_send]
+        return [future.result() for future in futures]
+
+    def submit(self, function: Callable[[], Any]) -> Future:
+        '''Runs a job in the background'''
+        return self._jobs.submit(function)
+
+    def close(self) -> None:
+        self._jobs.shutdown()
+        self._requests.shutdown()
+        self.session.close()
+
+
+_default_fetcher: Optional[HttpFetcher] = None
+
+
+def default_fetcher() -> HttpFetcher:
+    '''Returns the fetcher shared by providers that were not given one'''
+    global _default_fetcher
+    if _default_fetcher is None:
+        _default_fetcher = HttpFetcher()
+    return _default_fetcher
@@ -0,0 +1,110 @@
+import requests
+
+from .http import HttpFetcher, default_fetcher
+from .rate_table import RateTable
+from .store import RateStore
+from concurrent.futures import Future
+from datetime import date, timedelta
+from profiling.metrics import metrics
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+class RateProvider:
+    '''Base class for the exchange rate providers.
+    Subclasses describe how to request and parse the rates of some currencies for a date range.
+    This class works out which ranges are missing from the store, fetches them concurrently
+    and builds one rate table per currency. Providers with MULTI_CURRENCY set get every currency
+    missing the same range in a single request.
+    A failed fetch is not tried again: every later lookup fails with its error.'''
+
+    PROVIDER = ''
+    CURRENCIES: Tuple[str, ...] = ()
+    MULTI_CURRENCY = False
+
+    def __init__(self, start_date: date, end_date: date, store: Optional[RateStore] = None,
+                 fetcher: Optional[HttpFetcher] = None, currencies: Optional[Iterable[str]] = None) -> None:
+        self.start_date = start_date - timedelta(days=5)
+        self.end_date = end_date
+        self.store = store
+        self.fetcher = fetcher if fetcher is not None else default_fetcher()
+        self.currencies = tuple(currencies) if currencies is not None else self.CURRENCIES
+        self.tables: Dict[str, RateTable] = {}
+        self._built = False
+        self._error: Optional[Exception] = None
+        self._pending: Optional[Future] = None
+
+    def _pair(self, currency: str) -> str:
+        raise NotImplementedError
+
+    def _request(self, currencies: Sequence[str], start_date: date, end_date: date) -> Tuple[str, Any]:
+        '''Returns the url and parameters to fetch the rates of the currencies'''
+        raise NotImplementedError
+
+    def _parse(self, response: requests.Response, currencies: Sequence[str]) -> Dict[str, Dict[str, float]]:
+        '''Returns the rates in the response per currency, keyed by ISO date'''
+        raise NotImplementedError
+
+    def _fetch_rates(self) -> Dict[str, Dict[str, float]]:
+        # (start, end) -> currencies missing that range
+        missing: Dict[Tuple[date, date], List[str]] = {}
+        for currency in self.currencies:
+            if self.store is None:
+                ranges = [(self.start_date, self.end_date)]
+            else:
+                ranges = self.store.missing_ranges(self.PROVIDER, self._pair(currency), self.start_date, self.end_date)
+            for date_range in ranges:
+                missing.setdefault(date_range, []).append(currency)
+
+        jobs: List[Tuple[List[str], date, date]] = []
+        for (start_date, end_date), currencies in missing.items():
+            if self.MULTI_CURRENCY:
+                jobs.append((currencies, start_date, end_date))
+            else:
+                jobs += [([currency], start_date, end_date) for currency in currencies]
+
+        rates = {currency: {} for currency in self.currencies}
+        if len(jobs) > 0:
+            responses = self.fetcher.get_many([self._request(*job) for job in jobs])
+            for (currencies, start_date, end_date), response in zip(jobs, responses):
+                fetched = self._parse(response, currencies)
+                for currency in currencies:
+                    if self.store is not None:
+                        self.store.save(self.PROVIDER, self._pair(currency), start_date, end_date, fetched[currency])
+                    rates[currency].update(fetched[currency])
+
+        if self.store is not None:
+            for currency in self.currencies:
+                rates[currency] = self.store.load(self.PROVIDER, self._pair(currency), self.start_date, self.end_date)
+        return rates
+
+    def _build_tables(self) -> None:
+        try:
+            with metrics.timer(f'rates.fetch.{self.PROVIDER}'):
+                rates = self._fetch_rates()
+        except Exception as e:
+            self._error = e
+            metrics.add(f'rates.failed.{self.PROVIDER}')
+            return
+        # A currency without any rate in the period has no table, only its lookups fail
+        self.tables = {currency: RateTable(rates[currency]) for currency in self.currencies if len(rates[currency]) > 0}
+        self._built = True
+
+    def prefetch(self) -> None:
+        '''Starts fetching the rates in the background, so the download overlaps with other work'''
+        if self._pending is None and not self._built and self._error is None:
+            self._pending = self.fetcher.submit(self._build_tables)
+
+    def rate_table(self, currency: str) -> RateTable:
+        '''Returns the rate table of a currency, waiting for or fetching the rates if needed'''
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            pending.result()
+        if not self._built and self._error is None:
+            self._build_tables()
+        if self._error is not None:
+            raise ValueError(f'Could not fetch the {self.PROVIDER} rates: {self._error}')
+        if currency not in self.currencies:
+            raise ValueError(f'Currency not supported by {self.PROVIDER}: {currency}')
+        if currency not in self.tables:
+            raise ValueError(f'No {self.PROVIDER} rates for {currency} in the period')
+        return self.tables[currency]
@@ -0,0 +1,98 @@
+from array import array
+from datetime import date
+from profiling.metrics import metrics
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+class RateTable:
+    '''Daily exchange rates stored in a dense array indexed by day ordinal.
+    Days without a published rate (weekends, holidays) carry the previous rate forward,
+    so a lookup is a single subtraction and index.'''
+
+    def __init__(self, rates: Dict[str, float]) -> None:
+        if len(rates) == 0:
+            raise ValueError('Cannot build a rate table without rates')
+
+        published = sorted((date.fromisoformat(d).toordinal(), rate) for d, rate in rates.items())
+        self.first_ordinal = published[0][0]
+        self.last_ordinal = published[-1][0]
+
+        self._rates = array('d', [0.0]) * (self.last_ordinal - self.first_ordinal + 1)
+        next_index = 0
+        last_rate = published[0][1]
+        for ordinal, rate in published:
+            index = ordinal - self.first_ordinal
+            for i in range(next_index, index):
+                self._rates[i] = last_rate
+            self._rates[index] = rate
+            last_rate = rate
+            next_index = index + 1
+
+    @classmethod
+    def from_array(cls, first_ordinal: int, rates: array) -> 'RateTable':
+        '''Builds a table from rates already laid out per day, starting at first_ordinal'''
+        if len(rates) == 0:
+            raise ValueError('Cannot build a rate table without rates')
+        table = cls.__new__(cls)
+        table.first_ordinal = first_ordinal
+        table.last_ordinal = first_ordinal + len(rates) - 1
+        table._rates = rates
+        return table
+
+    @property
+    def first_date(self) -> date:
+        return date.fromordinal(self.first_ordinal)
+
+    @property
+    def last_date(self) -> date:
+        return date.fromordinal(self.last_ordinal)
+
+    def __len__(self) -> int:
+        return len(self._rates)
+
+    def lookup(self, day: date) -> float:
+        '''Returns the rate published on the given day or the closest day before it'''
+        if metrics.enabled:
+            metrics.add('rates.lookups')
+        index = day.toordinal() - self.first_ordinal
+        if index < 0:
+            raise ValueError(self.missing_rate_message(day))
+        if index >= len(self._rates):
+            return self._rates[-1]
+        return self._rates[index]
+
+    def _at(self, ordinal: int) -> float:
+        return self._rates[min(ordinal, self.last_ordinal) - self.first_ordinal]
+
+    def lookup_many(self, ordinals: Sequence[int]) -> Tuple[array, List[bool]]:
+        '''Returns the rates for many day ordinals at once, together with a mask
+        of the days that fall before the first published rate (their rate is NaN)'''
+        metrics.add('rates.lookups', len(ordinals))
+        rates = self._rates
+        last_index = len(rates) - 1
+        indexes = [min(ordinal - self.first_ordinal, last_index) for ordinal in ordinals]
+        missing = [index < 0 for index in indexes]
+        values = array('d', [rates[index] if index >= 0 else float('nan') for index in indexes])
+        return values, missing
+
+    def missing_rate_message(self, day: date) -> str:
+        return f'No rate found for {day}: the first published rate is from {self.first_date}'
+
+
+def cross_rates(numerator: Optional[RateTable], denominator: Optional[RateTable]) -> RateTable:
+    '''Returns the table of numerator / denominator for every day, where None stands for a rate of 1.
+    It starts on the first day both tables have a rate and ends on the last day either has one.'''
+    tables = [t for t in (numerator, denominator) if t is not None]
+    if len(tables) == 0:
+        raise ValueError('Cannot cross two missing rate tables')
+    first_ordinal = max(t.first_ordinal for t in tables)
+    last_ordinal = max(t.last_ordinal for t in tables)
+
+    ordinals = range(first_ordinal, last_ordinal + 1)
+    if denominator is None:
+        rates = array('d', [numerator._at(o) for o in ordinals])
+    elif numerator is None:
+        rates = array('d', [1 / denominator._at(o) for o in ordinals])
+    else:
+        rates = array('d', [numerator._at(o) / denominator._at(o) for o in ordinals])
+    return RateTable.from_array(first_ordinal, rates)
@@ -0,0 +1,92 @@
+import os
+import threading
+
+from datetime import date, timedelta
+from storage.sqlite_state import connect
+from typing import Dict, List, Tuple
+
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS rates (
+    provider TEXT NOT NULL,
+    pair TEXT NOT NULL,
+    date TEXT NOT NULL,
+    rate REAL NOT NULL,
+    PRIMARY KEY (provider, pair, date)
+);
+CREATE TABLE IF NOT EXISTS fetched_ranges (
+    provider TEXT NOT NULL,
+    pair TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL
+);
+'''
+
+
+def default_cache_dir() -> str:
+    '''Returns the directory used to persist data between runs'''
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'expense-tracker')
+
+
+class RateStore:
+    '''Exchange rates persisted in SQLite and shared by the rate providers.
+    It also records which date ranges were already fetched for each provider and currency pair,
+    so only the missing ranges have to be downloaded.'''
+
+    def __init__(self, path: str) -> None:
+        self._lock = threading.Lock()
+        self._connection = connect(path, _SCHEMA)
+
+    @classmethod
+    def in_cache_dir(cls, cache_dir: str) -> 'RateStore':
+        return cls(os.path.join(cache_dir, 'rates.sqlite'))
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def missing_ranges(self, provider: str, pair: str, start_date: date, end_date: date) -> List[Tuple[date, date]]:
+        '''Returns the date ranges between start_date and end_date (inclusive) that were never fetched'''
+        with self._lock:
+            cursor = self._connection.execute(
+                'SELECT start_date, end_date FROM fetched_ranges '
+                'WHERE provider = ? AND pair = ? AND end_date >= ? AND start_date <= ? '
+                'ORDER BY start_date',
+                (provider, pair, start_date.isoformat(), end_date.isoformat()))
+            fetched = cursor.fetchall()
+
+        missing = []
+        next_missing = start_date
+        for fetched_start, fetched_end in fetched:
+            fetched_start = date.fromisoformat(fetched_start)
+            fetched_end = date.fromisoformat(fetched_end)
+            if fetched_start > next_missing:
+                missing.append((next_missing, fetched_start - timedelta(days=1)))
+            next_missing = max(next_missing, fetched_end + timedelta(days=1))
+            if next_missing > end_date:
+                break
+        if next_missing <= end_date:
+            missing.append((next_missing, end_date))
+        return missing
+
+    def save(self, provider: str, pair: str, start_date: date, end_date: date, rates: Dict[str, float]) -> None:
+        '''Stores the rates fetched for a date range.
+        Rates for today or later may still be published, so that part of the range is not marked as fetched.'''
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO rates (provider, pair, date, rate) VALUES (?, ?, ?, ?)',
+                [(provider, pair, d, rate) for d, rate in rates.items()])
+
+            final_date = min(end_date, date.today() - timedelta(days=1))
+            if final_date >= start_date:
+                self._connection.execute(
+                    'INSERT INTO fetched_ranges (provider, pair, start_date, end_date) VALUES (?, ?, ?, ?)',
+                    (provider, pair, start_date.isoformat(), final_date.isoformat()))
+
+    def load(self, provider: str, pair: str, start_date: date, end_date: date) -> Dict[str, float]:
+        '''Returns the stored rates between start_date and end_date (inclusive), ordered by date'''
+        with self._lock:
+            cursor = self._connection.execute(
+                'SELECT date, rate FROM rates WHERE provider = ? AND pair = ? AND date BETWEEN ? AND ? ORDER BY date',
+                (provider, pair, start_date.isoformat(), end_date.isoformat()))
+            return dict(cursor.fetchall())
@@ -1,26 +1,41 @@
 import argparse
-import csv
+import atexit
 import os
 import sys
 
-from currency.bacen import ExchangeRateBacen
-from currency.converter import ConverterSelector
-from currency.ecb import ExchangeRateECB
-from datetime import date, datetime
-from dotenv import load_dotenv
-from openai import OpenAI
-from parser import amex, commerzbank, inter, lufthansa, n26
-from typing import Dict, List, Tuple
-
-parsers = {
-    '.pdf': [amex.extract_data],
-    '.csv': [commerzbank.extract_data, inter.extract_data, lufthansa.extract_data, n26.extract_data]
+from category.llm import LlmClassifier
+from category.local import LocalClassifier
+from category.store import CategoryStore
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from currency.converter import ConvertedColumns, ConverterSelector
+from currency.store import RateStore, default_cache_dir
+from datetime import date, timedelta
+from functools import partial
+from itertools import chain, islice
+from parser import registry
+from parser.transaction import Transaction, from_cents
+from pipeline.scheduler import StageScheduler
+from profiling.metrics import metrics
+from storage.fingerprints import FingerprintIndex
+from storage.ledger import IngestionLedger
+from storage.output import Output, Row, open_output, output_path, read_output
+from storage.rollups import AMOUNT_COLUMNS, DIMENSIONS, RollupStore
+from storage.state import RunState, ledger_path
+from storage.transfers import TransferIndex
+from storage.watcher import FolderWatcher
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+cents_fields = {
+    'EUR': 'eur_cents',
+    'USD': 'usd_cents',
+    'BRL': 'brl_cents'
 }
 
 def get_files(folder: str) -> Dict[str, List[str]]:
     '''Returns a dictionary with the files in the folder, grouped by extension'''
     files = {}
-    for file in os.listdir(folder):
+    for file in sorted(os.listdir(folder)):
         file = os.path.join(folder, file)
         if os.path.isfile(file):
             _, extension = os.path.splitext(file)
@@ -31,109 +46,637 @@ def get_files(folder: str) -> Dict[str, List[str]]:
     return files
 
 
-def find_max_min_dates(transactions: List[Dict]) -> Tuple[date, date]:
-    '''Returns the minimum and maximum date from a list of transactions'''
+def skip_unchanged_files(files: Dict[str, List[str]], ledger: IngestionLedger) -> Dict[str, List[str]]:
+    '''Removes the files that were already ingested and did not change since'''
+    remaining = {}
+    for extension, files_by_extension in files.items():
+        changed = [file for file in files_by_extension if not ledger.is_unchanged(file)]
+        if len(changed) > 0:
+            remaining[extension] = changed
+    return remaining
+
+
+def parser_options(file_format: registry.Format, pdf_mode: str) -> Dict[str, str]:
+    '''Returns the keyword arguments to give to the parser of the format'''
+    if file_format.name == 'amex':
+        return {'mode': pdf_mode}
+    return {}
+
+
+# Format name, file id and transactions of a parsed file, or the reason why it could not be parsed
+ParseResult = Tuple[Optional[str], Optional[str], List[Transaction], Optional[str]]
+
+
+def parse_file(file: str, extension: str, pdf_mode: str = 'tables') -> ParseResult:
+    '''Detects the format of the file and parses it with the matching parser.
+    Returns the format name, the file id and the transactions, or the reason why the file could not be parsed.'''
+    format_name = None
+    try:
+        file_format = registry.detect(file, extension)
+        format_name = file_format.name
+        with metrics.timer(f'parse.{format_name}'):
+            file_id, transactions = registry.get_parser(file_format).extract_file(file, **parser_options(file_format, pdf_mode))
+        return format_name, file_id, transactions, None
+    except Exception as e:
+        metrics.add('parse.failed')
+        return format_name, None, [], str(e) if format_name is None else f'{format_name}: {e!r}'
+
+
+def parse_pdf_page(file: str, page_number: int, pdf_mode: str = 'tables') -> Tuple[List[Tuple[str, str, str]], Optional[str]]:
+    '''Extracts the raw rows of one page of an AMEX pdf file, or the reason why it failed'''
+    from parser import amex
+
+    try:
+        with metrics.timer('parse.amex.page'):
+            return amex.extract_page_rows(file, page_number, pdf_mode), None
+    except Exception as e:
+        metrics.add('parse.failed')
+        return [], f'page {page_number + 1}: {e!r}'
+
+
+def run_in_worker(function: Callable, profile: bool, *args):
+    '''Runs function in a pool process and returns its result with the metrics it collected there'''
+    if profile:
+        metrics.reset()
+        metrics.enable()
+    return function(*args), metrics.snapshot() if profile else None
+
+
+def _worker_result(future: Future):
+    result, snapshot = future.result()
+    if snapshot is not None:
+        metrics.merge(snapshot)
+    return result
+
+
+def _submit_pdf_pages(pool: Executor, file: str, pdf_mode: str) -> List[Future]:
+    '''Sends each page of the pdf file to the pool'''
+    from parser import amex
+
+    return [pool.submit(run_in_worker, parse_pdf_page, metrics.enabled, file, i, pdf_mode) for i in range(amex.count_pages(file))]
+
+
+def _collect_pdf_pages(file: str, page_futures: List[Future]) -> ParseResult:
+    '''Assembles the transactions of a pdf file parsed page by page'''
+    from parser import amex
+
+    page_rows = []
+    for future in page_futures:
+        rows, error = _worker_result(future)
+        if error is not None:
+            return 'amex', None, [], f'amex: {error}'
+        page_rows.append(rows)
+
+    try:
+        file_id, transactions = amex.assemble_file(file, page_rows)
+        return 'amex', file_id, transactions, None
+    except Exception as e:
+        return 'amex', None, [], f'amex: {e!r}'
+
+
+def parse_tasks(files: Dict[str, List[str]]) -> List[Tuple[str, str]]:
+    return [(file, extension) for extension, files_by_extension in files.items() for file in files_by_extension]
+
+
+@contextmanager
+def parse_pool(jobs: int) -> Iterator[Optional[Executor]]:
+    '''Opens the pool of processes the files are parsed in when jobs > 1, else gives None'''
+    if jobs <= 1:
+        yield None
+        return
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        yield pool
+
+
+def start_parsing(tasks: List[Tuple[str, str]], pool: Optional[Executor], split_pages: bool = False,
+                  pdf_mode: str = 'tables') -> List[Callable[[], ParseResult]]:
+    '''Submits the files to the pool, when there is one, and returns for each file a function giving its result.
+    Without a pool the file is parsed when its function is called.'''
+    if pool is None:
+        return [partial(parse_file, file, extension, pdf_mode) for file, extension in tasks]
+
+    results = []
+    for file, extension in tasks:
+        page_futures = None
+        if split_pages and extension == '.pdf':
+            try:
+                if registry.detect(file, extension).name == 'amex':
+                    page_futures = _submit_pdf_pages(pool, file, pdf_mode)
+            except Exception:
+                # Let parse_file report why the file cannot be read
+                metrics.add('parse.split_pages_failed')
+        if page_futures is not None:
+            results.append(partial(_collect_pdf_pages, file, page_futures))
+        else:
+            results.append(partial(_worker_result, pool.submit(run_in_worker, parse_file, metrics.enabled, file, extension, pdf_mode)))
+    return results
+
+
+def report_parsed(file: str, result: ParseResult) -> bool:
+    '''Prints what was found in the file, returning whether it could be parsed'''
+    format_name, _, file_transactions, error = result
+    if error is not None:
+        print(f'Could not parse file {file}: {error}')
+        return False
+    print(f'{file}: {format_name}, {len(file_transactions)} transactions')
+    return True
+
+
+def iter_new_files(files: Dict[str, List[str]], ledger: IngestionLedger, pdf_mode: str = 'tables') -> Iterator[Tuple[str, str, Iterator[Transaction]]]:
+    '''Yields the path, the file id and a lazy iterator over the transactions of each file not ingested yet'''
+    for extension, files_by_extension in files.items():
+        for file in files_by_extension:
+            try:
+                file_format = registry.detect(file, extension)
+                file_id, rows = registry.get_parser(file_format).iter_file(file, **parser_options(file_format, pdf_mode))
+            except Exception as e:
+                print(f'Could not parse file {file}: {e}')
+                sys.exit(1)
+
+            if ledger.contains(file_id):
+                print(f'{file}: already ingested, skipping')
+                ledger.record(file_id, file)
+                continue
+            yield file, file_id, rows
+
+
+def record_rows(file: str, file_id: str, rows: Iterator[Transaction], ledger: IngestionLedger) -> Iterator[Transaction]:
+    '''Passes the rows of a file through and records the file in the ledger once all of them were read'''
+    count = 0
+    try:
+        for row in rows:
+            count += 1
+            yield row
+    except Exception as e:
+        print(f'Could not parse file {file}: {e!r}')
+        sys.exit(1)
+    ledger.record(file_id, file, count)
+    print(f'{file}: {count} transactions')
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+
+def scan_transactions(transactions: Iterable[Transaction]) -> Tuple[date, date, Set[str]]:
+    '''Returns the minimum and maximum date from the transactions and their original currencies'''
     min_date = date.max
     max_date = date.min
+    currencies = set()
 
     for transaction in transactions:
-        transaction_date = datetime.strptime(transaction['date'], '%Y-%m-%d').date()
+        transaction_date = transaction.date
         if transaction_date < min_date:
             min_date = transaction_date
         if transaction_date > max_date:
             max_date = transaction_date
+        currencies.add(transaction.original_currency)
     
-    return min_date, max_date
+    return min_date, max_date, currencies
 
 
-def get_transaction_categories(transactions: List[Dict]) -> List[str]:
-    '''Returns the unique categories from a list of transactions'''
+def build_converter(min_date: date, max_date: date, currencies: Set[str], args: argparse.Namespace) -> ConverterSelector:
+    '''Creates the rate providers for the period and starts fetching their rates in the background.
+    The ECB rates of every currency found are fetched at once, with USD for the output column;
+    Bacen gives the BRL legs, so its BRL rate is not needed.'''
+    from currency.bacen import ExchangeRateBacen
+    from currency.ecb import REFERENCE_CURRENCIES, ExchangeRateECB
+    from currency.http import default_fetcher
 
-    transaction_descriptions = "\n".join([str(i) + "," + t['description'] for i, t in enumerate(transactions)])
+    ecb_currencies = sorted(({'USD'} | currencies) & set(REFERENCE_CURRENCIES) - {'BRL'})
+    rate_store = None if args.no_cache else RateStore.in_cache_dir(args.cache_dir)
+    # One keep-alive session for every converter of the process
+    fetcher = default_fetcher()
+    ecb = ExchangeRateECB(min_date, max_date, rate_store, fetcher, currencies=ecb_currencies)
+    bacen = ExchangeRateBacen(min_date, max_date, rate_store, fetcher)
+    ecb.prefetch()
+    bacen.prefetch()
+    return ConverterSelector(bacen, ecb)
 
-    load_dotenv()
-    client = OpenAI()
 
-    chat_completion = client.chat.completions.create(
-        messages=[
-            {
-                "role": "system",
-                "content": "You are responsible for classifying transactions based on their description. Consider that I live in Potsdam/Germany but I might also have expenses in Brazil. The input will contain the transaction id and the transaction description separated by comma. For each input line, give as output the transaction id and the category separated by comma without anything else so I can parse it on my system. These are the possible categories:Salary,Contract Work,Investment Income,Rental Income,Other Income,Rent,Utilities,Insurance,Subscriptions,Groceries,Eating Out,Transportation,Healthcare,Subscriptions,Entertainment,Shopping,Education,Travel,Investment,Donations,Gifts,Fees and Charges,Transfers Between Accounts,Other Expenses",
-            },
-            {
-                "role": "user",
-                "content": transaction_descriptions,
-            }
-        ],
-        # model="gpt-4o-mini",
-        model="gpt-4o"
-    )
+def prepare_converter(transactions: List[Transaction],
+                      converter_for: Callable[[date, date, Set[str]], ConverterSelector]) -> Optional[ConverterSelector]:
+    '''Builds the converter for the period and currencies of the transactions and waits for its rates,
+    or gives None when there are no transactions'''
+    if len(transactions) == 0:
+        return None
+    with metrics.timer('stage.dates'):
+        min_date, max_date, currencies = scan_transactions(transactions)
+    converter = converter_for(min_date, max_date, currencies)
+    converter.prepare(currencies, cents_fields)
+    return converter
 
-    result = [None] * len(transactions)
-    for message in chat_completion.choices[0].message.content.split("\n"):
-        transaction_id, category = message.split(",")
-        result[int(transaction_id)] = category.strip()
 
-    return result
+class WarmConverter:
+    '''Keeps the converter between the batches of watch mode and the chunks of stream mode, with its rate tables in memory.
+    A new one is only built when a batch has dates or currencies the current one does not cover.
+    It then covers the dates seen so far and MARGIN around them, up to today, so statements read in date order
+    do not need one per chunk. A converter whose rates could not be fetched is kept for the dates it covers.'''
+
+    MARGIN = timedelta(days=31)
+
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self._converter: Optional[ConverterSelector] = None
+        # Dates and currencies of the rows seen, which the converter has rates for, and the dates it covers
+        self._seen: Tuple[date, date, Set[str]] = (date.max, date.min, set())
+        self._covered: Tuple[date, date] = (date.max, date.min)
+
+    def get(self, min_date: date, max_date: date, currencies: Set[str]) -> ConverterSelector:
+        covered_min, covered_max = self._covered
+        seen_min, seen_max, seen_currencies = self._seen
+        self._seen = (min(min_date, seen_min), max(max_date, seen_max), currencies | seen_currencies)
+        if self._converter is None or min_date < covered_min or max_date > covered_max or not currencies <= seen_currencies:
+            first, last, all_currencies = self._seen
+            self._covered = (first - self.MARGIN, max(min(last + self.MARGIN, date.today()), last))
+            self._converter = build_converter(*self._covered, all_currencies, self.args)
+        return self._converter
+
+
+def convert_transactions(transactions: List[Transaction], converter: ConverterSelector) -> ConvertedColumns:
+    '''Converts the original amount of every transaction to all the output currencies.
+    Rows in a currency without rates fail in the result, like rows without a rate on their date.'''
+    for t in transactions:
+        if t.cents(t.original_currency) is None:
+            print(f'Transaction {t.id} has no amount in its original currency {t.original_currency}')
+            sys.exit(1)
+
+    transaction_dates = [t.date for t in transactions]
+    original_amounts = [t.cents(t.original_currency) for t in transactions]
+    original_currencies = [t.original_currency for t in transactions]
+    return converter.convert_many(transaction_dates, original_amounts, original_currencies)
+
+
+class Classifiers(NamedTuple):
+    '''The classifiers of a run. classify uses the local classifier and the LLM it escalates to;
+    learner is the local classifier when it learns the rows written to the output, and warm_up
+    imports the LLM library ahead of the first request.'''
+    local: LocalClassifier
+    classify: Callable[[List[str]], List[Optional[str]]]
+    learner: Optional[LocalClassifier] = None
+    warm_up: Optional[Callable[[], Any]] = None
+
+
+def build_classifier(local_classifier: LocalClassifier, llm_classifier: Optional[LlmClassifier]) -> Callable[[List[str]], List[Optional[str]]]:
+    '''Classifies with the local model, escalating the descriptions it is unsure about to the LLM when there is one'''
+    fallback = llm_classifier.classify if llm_classifier is not None else None
+    return lambda descriptions: local_classifier.classify(descriptions, fallback)
+
+
+def categorize_transactions(transactions: List[Transaction], category_store: CategoryStore, classify: Callable[[List[str]], List[Optional[str]]]) -> List[Optional[str]]:
+    '''Returns the category of each transaction, classifying only descriptions not seen before'''
+    return category_store.categorize([t.description for t in transactions], classify)
+
+
+def print_duplicate_stats(fingerprints: FingerprintIndex) -> None:
+    if fingerprints.duplicates > 0:
+        print(f'Dropped {fingerprints.duplicates} transactions already in the output')
+
+
+def print_transfer_stats(transfers: TransferIndex) -> None:
+    if transfers.linked > 0:
+        print(f'Linked {transfers.linked} transfers between accounts')
+
+
+def update_local_model(local_classifier: LocalClassifier, output_file: str, appending: bool) -> None:
+    '''Saves the local classifier trained on the output once rows were written to it.
+    Rows appended were learnt as they were written; a rewritten output is learnt again whole, which only reads this run's rows.'''
+    if appending:
+        local_classifier.mark_trained([output_file])
+    else:
+        local_classifier.train([output_file])
+    local_classifier.save()
+
+
+def print_category_stats(category_store: CategoryStore, local_classifier: LocalClassifier, offline: bool) -> None:
+    print(f'Categories: {category_store.hits} rows from the cache, {category_store.misses} rows not cached, '
+          f'{category_store.classified} new descriptions, {local_classifier.accepted} classified locally, '
+          f'{local_classifier.escalated} {"left without category" if offline else "sent to the model"}')
+
+
+def converted_rows(transactions: List[Transaction], categories: List[Optional[str]],
+                   converted: ConvertedColumns) -> Tuple[List[Row], List[Transaction]]:
+    '''Completes the transactions with their converted amounts.
+    Returns the rows and, apart, the transactions that could not be converted.'''
+    rows = []
+    failed = []
+    for i, t in enumerate(transactions):
+        amounts = {}
+        error = None
+        for currency, field in cents_fields.items():
+            if t.cents(currency) is None:
+                if converted.failed[currency][i]:
+                    error = converted.errors[currency][i]
+                    break
+                amounts[field] = converted.columns[currency][i]
+        if error is not None:
+            print(f'Could not convert transaction {t.id}: {error}')
+            failed.append(t)
+            continue
+
+        rows.append((t._replace(**amounts), categories[i]))
+    return rows, failed
+
+
+def write_rows(output: Output, rows: List[Row], state: RunState, learner: Optional[LocalClassifier] = None) -> None:
+    '''Links the transfers among the rows and with those written before, then writes them.
+    learner is the local classifier when it is trained on the output, and learns the rows.'''
+    with metrics.timer('stage.transfers'):
+        rows, earlier_links = state.transfers.link(rows)
+    with metrics.timer('stage.write'):
+        output.write(rows)
+        output.link(earlier_links)
+    state.fingerprints.add(t for t, _ in rows)
+    state.rollups.add(rows)
+    if learner is not None:
+        learner.learn((t.description, category) for t, category in rows)
+    metrics.add('rows.written', len(rows))
+
+
+def write_transactions(output: Output, transactions: List[Transaction], converter_for: Callable[[date, date, Set[str]], ConverterSelector],
+                       state: RunState, classifiers: Classifiers) -> List[Transaction]:
+    '''Categorizes the transactions while the rates for them are fetched and they are converted,
+    then writes them to the output and adds them to the rollups.
+    Returns the transactions that could not be converted, and were not written.'''
+    scheduler = StageScheduler()
+    scheduler.add('categorize', lambda: categorize_transactions(transactions, state.categories, classifiers.classify))
+    scheduler.add('rates', lambda: prepare_converter(transactions, converter_for))
+    scheduler.add('convert', lambda converter: convert_transactions(transactions, converter), inputs=['rates'])
+    results = scheduler.run()
+    rows, failed = converted_rows(transactions, results['categorize'], results['convert'])
+    write_rows(output, rows, state, classifiers.learner)
+    return failed
+
+
+def dedup_file(file: str, result: ParseResult, ledger: IngestionLedger, fingerprints: FingerprintIndex) -> Optional[List[Transaction]]:
+    '''Records a parsed file in the ledger and returns its transactions not in the output yet,
+    or None when it could not be parsed'''
+    if not report_parsed(file, result):
+        return None
+    _, file_id, file_transactions, _ = result
+    if ledger.contains(file_id):
+        print(f'{file}: already ingested, skipping')
+        ledger.record(file_id, file)
+        return []
+    ledger.record(file_id, file, len(file_transactions))
+    return list(fingerprints.filter(file_transactions))
+
+
+def try_warm_up(warm_up: Callable[[], Any]) -> None:
+    '''Runs warm_up, which only saves time: should it fail, categorization does the work and reports the error if needed'''
+    try:
+        warm_up()
+    except Exception:
+        metrics.add('warm_up.failed')
+
+
+def ingest_files(files: Dict[str, List[str]], args: argparse.Namespace, state: RunState, classifiers: Classifiers,
+                 converter_for: Callable[[date, date, Set[str]], ConverterSelector], exit_on_error: bool = True) -> int:
+    '''Parses the files, drops what the output already has and writes the rest, then saves the state.
+    Returns the number of new transactions.
+
+    The stages overlap: warm_up (importing the LLM library) runs while the files are parsed, each file is
+    deduplicated as soon as it is parsed, then categorization runs alongside the rate download and conversion.
+    Files are deduplicated one after the other, in the order of a sequential run.
+    Transfers are linked once the amounts are converted, just before the rows are written.'''
+    tasks = parse_tasks(files)
+    scheduler = StageScheduler()
+
+    def all_rows(*new_rows: Optional[List[Transaction]]) -> List[Transaction]:
+        # Files that could not be parsed end the run before anything is categorized or converted
+        if exit_on_error and any(r is None for r in new_rows):
+            sys.exit(1)
+        return list(chain.from_iterable(r or [] for r in new_rows))
+
+    def convert(converter: Optional[ConverterSelector], transactions: List[Transaction]) -> Optional[ConvertedColumns]:
+        return None if converter is None else convert_transactions(transactions, converter)
+
+    with parse_pool(args.jobs) as pool:
+        # Started first, so it runs while the files are parsed
+        if classifiers.warm_up is not None and len(tasks) > 0:
+            scheduler.add('warm_up', partial(try_warm_up, classifiers.warm_up))
+        for i, ((file, _), result) in enumerate(zip(tasks, start_parsing(tasks, pool, args.split_pages, args.pdf_mode))):
+            scheduler.add(f'parse:{i}', result, after=[f'parse:{i - 1}'] if i > 0 else [])
+            scheduler.add(f'dedup:{i}', partial(dedup_file, file, ledger=state.ledger, fingerprints=state.fingerprints),
+                          inputs=[f'parse:{i}'], after=[f'dedup:{i - 1}'] if i > 0 else [])
+
+        scheduler.add('rows', all_rows, inputs=[f'dedup:{i}' for i in range(len(tasks))])
+        scheduler.add('categorize', lambda transactions: categorize_transactions(transactions, state.categories, classifiers.classify),
+                      inputs=['rows'], after=['warm_up'] if 'warm_up' in scheduler else [])
+        scheduler.add('rates', lambda transactions: prepare_converter(transactions, converter_for), inputs=['rows'])
+        scheduler.add('convert', convert, inputs=['rates', 'rows'])
+        results = scheduler.run()
+
+    transactions = results['rows']
+
+    print_duplicate_stats(state.fingerprints)
+    if len(transactions) == 0:
+        print('No new transactions')
+        if state.appending:
+            # An output to write from scratch is left as it is, with the state of its previous run
+            state.save()
+        return 0
+
+    rows, failed = converted_rows(transactions, results['categorize'], results['convert'])
+    with open_output(args.output, state.appending) as output:
+        write_rows(output, rows, state, classifiers.learner)
+
+    if len(failed) > 0:
+        # Files with rows left out of the output stay out of the ledger, so the next run reads them again
+        file_ids = {t.id: results[f'parse:{i}'][1] for i in range(len(tasks)) for t in results[f'dedup:{i}'] or []}
+        failed_files = {file_ids[t.id] for t in failed}
+        for file_id in failed_files:
+            state.ledger.forget(file_id)
+        print(f'{len(failed_files)} files have rows that could not be converted, they will be read again on the next run')
+    state.save()
+    print_transfer_stats(state.transfers)
+    return len(transactions)
+
+
+def watch_folder(args: argparse.Namespace, state: RunState, classifiers: Classifiers) -> None:
+    '''Ingests the files already in the folder, then each burst of files dropped in it, until interrupted.
+    Rate tables, categories, the local model and the LLM client stay in memory between batches.'''
+    converter = WarmConverter(args)
+    # Watching starts first, so files dropped during the first batch are not missed
+    watcher = FolderWatcher(args.folder)
+    print(f'Watching {args.folder} {"with inotify" if watcher.uses_inotify else "by polling"}, press Ctrl+C to stop')
+
+    files = skip_unchanged_files(get_files(args.folder), state.ledger)
+    try:
+        while True:
+            if len(files) > 0:
+                state.fingerprints.duplicates = 0
+                state.transfers.linked = 0
+                with metrics.timer('stage.batch'):
+                    if ingest_files(files, args, state, classifiers, converter.get, exit_on_error=False) > 0:
+                        if classifiers.learner is not None:
+                            update_local_model(classifiers.learner, output_path(args.output), state.appending)
+                        state.appending = True
+            files = {}
+            for file in watcher.wait():
+                files.setdefault(os.path.splitext(file)[1], []).append(file)
+            files = skip_unchanged_files(files, state.ledger)
+    except KeyboardInterrupt:
+        print('Stopped watching')
+    finally:
+        watcher.close()
+        print_category_stats(state.categories, classifiers.local, args.offline)
+
+
+def print_report(argv: List[str]) -> None:
+    '''The report subcommand: totals of the output per month, category, source or currency, read from the rollups'''
+    p = argparse.ArgumentParser(prog='main.py report', description='Print the totals of the transactions in the output')
+    p.add_argument('--by', choices=DIMENSIONS, action='append', help='Column to group by, can be repeated (default: month and category)')
+    p.add_argument('--currency', choices=tuple(AMOUNT_COLUMNS), default='EUR', help='Currency of the amounts')
+    p.add_argument('--from', dest='start_month', type=str, help='First month, as YYYY-MM')
+    p.add_argument('--to', dest='end_month', type=str, help='Last month, as YYYY-MM')
+    p.add_argument('--state-dir', type=str, default='.expense-tracker', help='Folder where the record of ingested files is kept')
+    p.add_argument('--output', type=str, default='output.csv', help='Output the rollups are built from when they do not cover it yet')
+    p.add_argument('--rebuild', action='store_true', help='Build the rollups again from the output')
+    args = p.parse_args(argv)
+    by = args.by or ['month', 'category']
+
+    rollups = RollupStore.in_state_dir(args.state_dir)
+    output_file = output_path(args.output)
+    if args.rebuild or not rollups.is_complete():
+        if not os.path.exists(output_file):
+            print(f'No output at {output_file} to build the rollups from')
+            sys.exit(1)
+        rollups.rebuild(read_output(output_file))
+
+    rows = rollups.query(by, args.currency, args.start_month, args.end_month)
+    rollups.close()
+
+    widths = [max([len(column)] + [len(row[i] or '-') for row in rows]) for i, column in enumerate(by)]
+    print(' '.join(f'{column:<{width}}' for column, width in zip(by, widths)) + f' {"count":>8} {args.currency:>14}')
+    for *groups, count, cents in rows:
+        print(' '.join(f'{group or "-":<{width}}' for group, width in zip(groups, widths)) + f' {count:>8} {from_cents(cents):>14.2f}')
 
 
 if __name__ == '__main__':
-    p = argparse.ArgumentParser(description='Parse financial files')
+    if len(sys.argv) > 1 and sys.argv[1] == 'report':
+        print_report(sys.argv[2:])
+        sys.exit(0)
+
+    p = argparse.ArgumentParser(description='Parse financial files', epilog='Run main.py report --help for the totals of the output')
     p.add_argument('folder', type=str, help='Folder with financial files')
+    p.add_argument('--cache-dir', type=str, default=default_cache_dir(), help='Folder where exchange rates are cached between runs')
+    p.add_argument('--jobs', type=int, default=1, help='Number of processes used to parse the files')
+    p.add_argument('--pdf-mode', choices=registry.PDF_EXTRACTION_MODES, default='tables', help='How rows are read from pdf statements: tables (default), text (faster) or check (both, failing when they disagree)')
+    p.add_argument('--split-pages', action='store_true', help='With --jobs, parse each page of pdf files in its own job')
+    p.add_argument('--output', type=str, default='output.csv', help='Csv file the transactions are written to, or sqlite:PATH to upsert them into a SQLite database')
+    p.add_argument('--state-dir', type=str, default='.expense-tracker', help='Folder where the record of ingested files is kept')
+    p.add_argument('--full', action='store_true', help='Reprocess every file and rewrite the output from scratch')
+    p.add_argument('--no-cache', action='store_true', help='Always download exchange rates instead of using the cache')
+    p.add_argument('--corrections', type=str, help='Csv file with description and category columns, whose categories override the model')
+    p.add_argument('--offline', action='store_true', help='Only use the local classifier, never the LLM')
+    p.add_argument('--min-confidence', type=float, default=0.5, help='Confidence below which the local classifier defers to the LLM')
+    p.add_argument('--retrain', action='store_true', help='Train the local classifier again from the whole output, which it otherwise only does when the output was changed by something else')
+    p.add_argument('--train-from', type=str, action='append', help='Previous output file the local classifier learns from (default: the current output)')
+    p.add_argument('--llm-concurrency', type=int, default=4, help='Maximum number of categorization requests in flight')
+    p.add_argument('--stream', action='store_true', help='Stream the transactions through parsing, conversion and output in chunks, with bounded memory')
+    p.add_argument('--transfer-window', type=int, default=3, help='Days apart the two sides of a transfer between accounts can be booked, 0 to not link transfers')
+    p.add_argument('--transfer-tolerance', type=float, default=0.02, help='Relative difference allowed between the converted amounts of a transfer across currencies')
+    p.add_argument('--chunk-size', type=int, default=1000, help='Number of transactions per chunk in stream mode')
+    p.add_argument('--watch', action='store_true', help='Keep running and ingest the files dropped in the folder as they arrive')
+    p.add_argument('--profile', action='store_true', help='Time the stages, count requests, rate lookups and tokens, and print a summary')
+    p.add_argument('--profile-output', type=str, default='profile.json', help='File the --profile report is saved to as JSON')
     args = p.parse_args()
+    output_file = output_path(args.output)
 
-    files = get_files(args.folder)
+    if args.profile:
+        metrics.enable()
 
-    transactions = []
-    for extension, files_by_extension in files.items():
-        for file in files_by_extension:
-            parsed = False
-            if extension in parsers:
-                for parser in parsers[extension]:
-                    try:
-                        transactions += parser(file)
-                        parsed = True
-                    except Exception:
-                        pass
-            if not parsed:
-                print(f'Could not parse file {file}')
-                sys.exit(1)
+        def report_profile() -> None:
+            metrics.print_summary()
+            metrics.save(args.profile_output)
+            print(f'Profile saved to {args.profile_output}')
+        # The run can end in several places, the report is printed at whichever
+        atexit.register(report_profile)
 
-    min_date, max_date = find_max_min_dates(transactions)
-    ecb = ExchangeRateECB(min_date, max_date)
-    bacen = ExchangeRateBacen(min_date, max_date)
-    converter = ConverterSelector(bacen, ecb)
-
-    categories = get_transaction_categories(transactions)
-
-    with open('output.csv', 'w') as csvfile:
-        field_names = ['id', 'date', 'category', 'description', 'amount_eur', 'amount_usd', 'amount_brl', 'original_currency', 'source_id']
-        writer = csv.DictWriter(csvfile, fieldnames=field_names)
-        writer.writeheader()
-
-        for i, t in enumerate(transactions):
-            t['category'] = categories[i]
-
-            if t['original_currency'] == 'EUR':
-                original_amount = t['amount_eur']
-            elif t['original_currency'] == 'USD':
-                original_amount = t['amount_usd']
-            elif t['original_currency'] == 'BRL':
-                original_amount = t['amount_brl']
-            else:
-                print(f'Unknown currency {t["original_currency"]}')
-                sys.exit(1)
+    # The ledger only makes sense together with the output it describes
+    appending = not args.full and os.path.exists(output_file) and os.path.exists(ledger_path(args.state_dir))
+    if not args.full and os.path.exists(output_file) and not appending:
+        # Without the ledger nothing tells which rows the output has, appending could repeat all of them
+        print(f'No ledger in {args.state_dir}, rewriting {output_file} from scratch')
+    state = RunState.open(args.state_dir, appending, args.transfer_window, args.transfer_tolerance)
+    if appending and not state.rollups.is_complete():
+        state.rollups.rebuild(read_output(output_file))
 
-            try:
-                transaction_date = datetime.strptime(t['date'], '%Y-%m-%d').date()
-                if 'amount_eur' not in t or t['amount_eur'] == "":
-                    t['amount_eur'] = converter.convert(transaction_date, original_amount, t['original_currency'], 'EUR')
-                if 'amount_usd' not in t or t['amount_usd'] == "":
-                    t['amount_usd'] = converter.convert(transaction_date, original_amount, t['original_currency'], 'USD')
-                if 'amount_brl' not in t or t['amount_brl'] == "":
-                    t['amount_brl'] = converter.convert(transaction_date, original_amount, t['original_currency'], 'BRL')
-            except Exception as e:
-                print(f'Could not convert transaction {t["id"]}: {e}')
-                continue
+    if args.corrections is not None:
+        print(f'Imported {state.categories.import_corrections(args.corrections)} category corrections')
+
+    # The local model learns from the previous outputs, and is trained again when they changed other than by appending
+    local_classifier = LocalClassifier.in_state_dir(args.state_dir, args.min_confidence)
+    training_files = args.train_from or [output_file]
+    if args.retrain or not local_classifier.is_current(training_files):
+        print(f'Trained the local classifier with {local_classifier.train(training_files)} descriptions')
+        local_classifier.save()
+    llm_classifier = None if args.offline else LlmClassifier(max_in_flight=args.llm_concurrency)
+    classifiers = Classifiers(
+        local_classifier, build_classifier(local_classifier, llm_classifier),
+        # Trained on the output, the model learns the rows as they are written to it
+        learner=local_classifier if args.train_from is None else None,
+        # Importing the OpenAI library can be done while the files are parsed
+        warm_up=None if llm_classifier is None else llm_classifier.preload)
+
+    if args.watch:
+        watch_folder(args, state, classifiers)
+        sys.exit(0)
+
+    files = skip_unchanged_files(get_files(args.folder), state.ledger)
+
+    if args.stream:
+        # The files are read once: the rates of each chunk are fetched when it has dates or currencies not covered yet
+        converter = WarmConverter(args)
+        # File id of the rows of the current chunk, to leave the files with rows that could not be converted out of the ledger
+        file_ids: Dict[str, str] = {}
+
+        def file_rows(file: str, file_id: str, rows: Iterator[Transaction]) -> Iterator[Transaction]:
+            for t in state.fingerprints.filter(record_rows(file, file_id, rows, state.ledger)):
+                file_ids[t.id] = file_id
+                yield t
+
+        transactions = chain.from_iterable(file_rows(file, file_id, rows) for file, file_id, rows in iter_new_files(files, state.ledger, args.pdf_mode))
+        chunks = chunked(transactions, args.chunk_size)
+        first_chunk = next(chunks, None)
+        if first_chunk is None:
+            print('No new transactions')
+            if appending:
+                state.save()
+            sys.exit(0)
+
+        failed_files: Set[str] = set()
+        with open_output(args.output, appending) as output:
+            for chunk in chain([first_chunk], chunks):
+                failed_files |= {file_ids[t.id] for t in write_transactions(output, chunk, converter.get, state, classifiers)}
+                file_ids.clear()
+                output.flush()
+                # A file is recorded once its rows run out, which can be after the chunk with its failed rows
+                for file_id in failed_files:
+                    state.ledger.forget(file_id)
+                state.save()
+        for file_id in failed_files:
+            state.ledger.forget(file_id)
+        state.save()
+        if classifiers.learner is not None:
+            update_local_model(classifiers.learner, output_file, appending)
+        if len(failed_files) > 0:
+            print(f'{len(failed_files)} files have rows that could not be converted, they will be read again on the next run')
+        print_duplicate_stats(state.fingerprints)
+        print_transfer_stats(state.transfers)
+        print_category_stats(state.categories, local_classifier, args.offline)
+        sys.exit(0)
 
-            writer.writerow(t)
\ No newline at end of file
+    if ingest_files(files, args, state, classifiers, lambda *period: build_converter(*period, args)) == 0:
+        sys.exit(0)
+    if classifiers.learner is not None:
+        update_local_model(classifiers.learner, output_file, appending)
+    print_category_stats(state.categories, local_classifier, args.offline)
@@ -2,10 +2,27 @@ import argparse
 import csv
 import hashlib
 import pdfplumber
+import pypdfium2 as pdfium
 import re
 
+from .registry import PDF_EXTRACTION_MODES, PdfSignature
+from .transaction import Transaction
 from datetime import datetime
-from typing import Dict, List, Tuple
+from typing import Iterable, Iterator, List, Tuple
+
+
+SIGNATURE = PdfSignature(marker='American Express')
+
+# tables: rows come from pdfplumber's table detection
+# text: rows come straight from the page text extracted by pdfium, skipping pdfplumber's
+#       character parsing and table detection, which is much faster
+# check: uses both and fails when they disagree
+EXTRACTION_MODES = PDF_EXTRACTION_MODES
+
+_SOURCE_PATTERN = re.compile(r'^.+(xxxx-xxxxxx-\d+).+$')
+_FILE_ID_PATTERN = re.compile(r'^.+-\d{5}\s\d\d\.\d\d\.\d\d$')
+_YEARS_PATTERN = re.compile(r'vom\s(\d\d\.\d\d\.\d\d)bis\s(\d\d\.\d\d\.\d\d)')
+_ROW_PATTERN = re.compile(r'^(\d\d\.\d\d)\s(\d\d\.\d\d)\s(.+)\s(\d+,\d\d)$')
 
 
 def _get_source_id(text_lines: List[str]) -> str:
@@ -14,7 +31,7 @@ def _get_source_id(text_lines: List[str]) -> str:
         raise ValueError(('File does not contain enough lines to extract unique id'))
 
     if 'American Express' in text_lines[0]:
-        res = re.search(r'^.+(xxxx-xxxxxx-\d+).+$', text_lines[7])
+        res = _SOURCE_PATTERN.search(text_lines[7])
         if res is None:
             raise ValueError(('Could the source from file'))
         return "amex " + res.group(1)
@@ -29,7 +46,7 @@ def _get_file_id(text_lines: List[str]) -> str:
         raise ValueError(('File does not contain enough lines to extract unique id'))
 
     id_line = text_lines[7]
-    res = re.search(r'^.+-\d{5}\s\d\d\.\d\d\.\d\d$', id_line)
+    res = _FILE_ID_PATTERN.search(id_line)
     if res is None:
         raise ValueError(('Could not extract unique id from file'))
     
@@ -42,45 +59,129 @@ def _extract_years(text_lines: List[str]) -> Tuple[str, str]:
         raise ValueError(('File does not contain enough lines to extract years'))
 
     date_range_line = text_lines[18]
-    res = re.search(r'vom\s(\d\d\.\d\d\.\d\d)bis\s(\d\d\.\d\d\.\d\d)', date_range_line)
+    res = _YEARS_PATTERN.search(date_range_line)
     if res is None:
         raise ValueError(('Could not extract years from file'))
     
     return res.group(1)[-2:], res.group(2)[-2:]
 
 
-def extract_data(input_file: str) -> List[Dict[str, str]]:
-    '''Extracts the transactions data from the AMEX pdf file'''
-    transactions = []
+def _read_header(pdf: pdfplumber.PDF) -> Tuple[str, str, str, str]:
+    '''Reads the source id, the statement years and the file id from the first page'''
+    text = pdf.pages[0].extract_text()
+    text_lines = text.splitlines()
+    source_id = _get_source_id(text_lines)
+    year_start, year_end = _extract_years(text_lines)
+    file_id = _get_file_id(text_lines)
+    return source_id, year_start, year_end, file_id
+
+
+def _match_rows(lines: Iterable[str]) -> List[Tuple[str, str, str]]:
+    '''Returns the (day.month, description, amount) of each line that is a transaction'''
+    rows = []
+    for line in lines:
+        res = _ROW_PATTERN.search(line)
+        if res is not None:
+            rows.append((res.group(1), res.group(3), res.group(4)))
+    return rows
+
+
+def _table_rows(page: pdfplumber.page.Page) -> List[Tuple[str, str, str]]:
+    return _match_rows(row[0] or '' for table in page.extract_tables() for row in table)
+
+
+def _text_rows(document: pdfium.PdfDocument, page_index: int) -> List[Tuple[str, str, str]]:
+    '''Matches the lines of the page text laid out by pdfium, without any table detection'''
+    page = document[page_index]
+    text_page = page.get_textpage()
+    try:
+        text = text_page.get_text_range()
+    finally:
+        text_page.close()
+        page.close()
+    return _match_rows(line.strip() for line in text.splitlines())
+
+
+def _iter_transactions(header: Tuple[str, str, str, str], page_rows: Iterable[List[Tuple[str, str, str]]]) -> Iterator[Transaction]:
+    source_id, year_start, year_end, file_id = header
+    i = 1
+    for rows in page_rows:
+        for day_month, description, amount in rows:
+            if day_month[-2:] == '01':
+                year = year_end
+            else:
+                year = year_start
+
+            transaction_date_str = day_month + '.' + year
+            transaction_date = datetime.strptime(transaction_date_str, '%d.%m.%y').date()
+            # Amounts always have two decimals, so dropping the comma gives the cents
+            yield Transaction(file_id + str(i), transaction_date, description, 'EUR', source_id,
+                              eur_cents=-int(amount.replace(',', '')))
+            i += 1
+
+
+def _iter_page_rows(pdf: pdfplumber.PDF, input_file: str, mode: str) -> Iterator[List[Tuple[str, str, str]]]:
+    '''Yields the transaction rows of each page of the pdf, closing it once done'''
+    if mode not in EXTRACTION_MODES:
+        raise ValueError(f'Unknown extraction mode {mode}')
+
+    document = pdfium.PdfDocument(input_file) if mode != 'tables' else None
+    with pdf:
+        try:
+            for page in pdf.pages:
+                if mode == 'text':
+                    rows = _text_rows(document, page.page_number - 1)
+                else:
+                    rows = _table_rows(page)
+                    if mode == 'check':
+                        text_rows = _text_rows(document, page.page_number - 1)
+                        if text_rows != rows:
+                            raise ValueError(f'Page {page.page_number}: text extraction found {len(text_rows)} rows '
+                                             f'and table extraction found {len(rows)}, or their content differs')
+                # Drop the parsed layout of the page, so memory does not grow with the number of pages
+                page.close()
+                yield rows
+        finally:
+            if document is not None:
+                document.close()
+
+
+def count_pages(input_file: str) -> int:
+    '''Returns the number of pages of the AMEX pdf file'''
     with pdfplumber.open(input_file) as pdf:
-        text = pdf.pages[0].extract_text()
-        text_lines = text.splitlines()
-        source_id = _get_source_id(text_lines)
-        year_start, year_end = _extract_years(text_lines)
-
-        file_id = _get_file_id(text_lines)
-
-        i = 1
-        for page in pdf.pages:
-            for table in page.extract_tables():
-                for row in table:
-                    res = re.search(r'^(\d\d\.\d\d)\s(\d\d\.\d\d)\s(.+)\s(\d+,\d\d)$', row[0])
-                    if res is not None:
-                        if res.group(1)[-2:] == '01':
-                            year = year_end
-                        else:
-                            year = year_start
-
-                        transaction_date_str = res.group(1) + '.' + year
-                        transaction_date = datetime.strptime(transaction_date_str, '%d.%m.%y')
-                        row_dict = {
-                            'id': file_id + str(i),
-                            'date': transaction_date.strftime('%Y-%m-%d'),
-                            'description': res.group(3),
-                            'amount_eur': float('-' + res.group(4).replace(',', '.')),
-                            'original_currency': 'EUR',
-                            'source_id': source_id
-                        }
-                        transactions.append(row_dict)
-                        i += 1
-    return transactions
+        return len(pdf.pages)
+
+
+def extract_page_rows(input_file: str, page_number: int, mode: str = 'tables') -> List[Tuple[str, str, str]]:
+    '''Extracts the raw transaction rows of a single page, so pages can be parsed in parallel'''
+    pdf = pdfplumber.open(input_file, pages=[page_number + 1])
+    return list(_iter_page_rows(pdf, input_file, mode))[0]
+
+
+def assemble_file(input_file: str, page_rows: List[List[Tuple[str, str, str]]]) -> Tuple[str, List[Transaction]]:
+    '''Builds the file id and the transactions from the rows extracted page by page with extract_page_rows'''
+    with pdfplumber.open(input_file, pages=[1]) as pdf:
+        header = _read_header(pdf)
+    return header[3], list(_iter_transactions(header, page_rows))
+
+
+def iter_file(input_file: str, mode: str = 'tables') -> Tuple[str, Iterator[Transaction]]:
+    '''Returns the file id and an iterator that reads the transactions lazily, page by page'''
+    pdf = pdfplumber.open(input_file)
+    try:
+        header = _read_header(pdf)
+    except Exception:
+        pdf.close()
+        raise
+    return header[3], _iter_transactions(header, _iter_page_rows(pdf, input_file, mode))
+
+
+def extract_file(input_file: str, mode: str = 'tables') -> Tuple[str, List[Transaction]]:
+    '''Extracts the file id and the transactions data from the AMEX pdf file'''
+    file_id, transactions = iter_file(input_file, mode)
+    return file_id, list(transactions)
+
+
+def extract_data(input_file: str, mode: str = 'tables') -> List[Transaction]:
+    '''Extracts the transactions data from the AMEX pdf file'''
+    return extract_file(input_file, mode)[1]
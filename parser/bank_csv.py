@@ -0,0 +1,148 @@
+import codecs
+import csv
+import hashlib
+import io
+import logging
+
+from .transaction import CURRENCIES, Transaction, to_cents
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+
+_DE_NUMBER = str.maketrans({'.': None, ',': '.'})
+
+
+class BankCsvSpec(NamedTuple):
+    '''Declarative description of a bank csv export.
+    Columns are referenced by their header name; the engine resolves them to positions once per file.'''
+    source_id: str
+    delimiter: str
+    date_column: str
+    description_column: str
+    amount_column: str
+    # Currency of the amount column, the currency of the account
+    amount_currency: str
+    # strptime format of the date column, or None when it is already an ISO date
+    date_format: Optional[str] = None
+    # 'de' for 1.234,56 or 'en' for 1234.56
+    number_locale: str = 'en'
+    encoding: str = 'utf-8'
+    # Lines before the header line
+    skip_lines: int = 0
+    # Header names replaced by position, e.g. to tell apart two columns with the same name
+    header_overrides: Tuple[Tuple[int, str], ...] = ()
+    currency_column: Optional[str] = None
+    default_currency: str = 'EUR'
+    # Column with the amount in the original currency, when it is not the currency of the account
+    foreign_amount_column: Optional[str] = None
+    negate_foreign_amount: bool = False
+    # (column, value) of rows that are not booked yet and must be skipped
+    skip_when: Optional[Tuple[str, str]] = None
+
+
+@lru_cache(maxsize=None)
+def _date_converter(date_format: Optional[str]) -> Callable[[str], date]:
+    # Statements repeat the same few hundred dates, so each one is only parsed once
+    # and the rows of the same day share their date object
+    if date_format is None:
+        return lru_cache(maxsize=8192)(date.fromisoformat)
+
+    @lru_cache(maxsize=8192)
+    def convert(text: str) -> date:
+        return datetime.strptime(text, date_format).date()
+    return convert
+
+
+def _number_converter(number_locale: str) -> Callable[[str], int]:
+    '''Returns a function converting the numbers of the locale to cents'''
+    if number_locale == 'de':
+        return lambda text: to_cents(text.translate(_DE_NUMBER))
+    if number_locale == 'en':
+        return to_cents
+    raise ValueError(f'Unknown number locale {number_locale}')
+
+
+def _read(spec: BankCsvSpec, input_file: str) -> Tuple[str, str]:
+    '''Reads the file once and returns its file id and its text.
+    The id is the hash of the text as read in universal newlines mode, so ids are the same
+    as the ones given by the previous parsers. That text is usually the raw bytes, which are hashed directly.'''
+    with open(input_file, 'rb') as f:
+        data = f.read()
+
+    text = data.decode(spec.encoding)
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+        hashed = text.encode()
+    elif data.startswith(codecs.BOM_UTF8) or spec.encoding.replace('-', '').lower() not in ('utf8', 'utf8sig'):
+        hashed = text.encode()
+    else:
+        hashed = data
+
+    return hashlib.sha256(hashed).hexdigest()[:16], text
+
+
+def _column_indexes(spec: BankCsvSpec, header: List[str]) -> Dict[str, int]:
+    header = list(header)
+    for index, name in spec.header_overrides:
+        header[index] = name
+    # Like csv.DictReader, a repeated column name refers to its last occurrence
+    return {name: i for i, name in enumerate(header)}
+
+
+def _iter_rows(spec: BankCsvSpec, text: str, file_id: str) -> Iterator[Transaction]:
+    position = 0
+    for _ in range(spec.skip_lines):
+        position = text.index('\n', position) + 1
+
+    reader = csv.reader(io.StringIO(text[position:]), delimiter=spec.delimiter)
+    columns = _column_indexes(spec, next(reader))
+    date_index = columns[spec.date_column]
+    description_index = columns[spec.description_column]
+    amount_index = columns[spec.amount_column]
+    currency_index = columns[spec.currency_column] if spec.currency_column else None
+    foreign_amount_index = columns[spec.foreign_amount_column] if spec.foreign_amount_column else None
+    skip_index, skip_value = (columns[spec.skip_when[0]], spec.skip_when[1]) if spec.skip_when else (None, None)
+
+    to_date = _date_converter(spec.date_format)
+    parse_amount = _number_converter(spec.number_locale)
+    source_id = spec.source_id
+    amount_currency = spec.amount_currency
+
+    i = 0
+    for row in reader:
+        if len(row) == 0:
+            continue
+        i += 1
+        if skip_index is not None and row[skip_index] == skip_value:
+            logging.warning(f'Row {i} is {skip_value}, not processed. Skipping...')
+            continue
+
+        currency = spec.default_currency
+        if currency_index is not None:
+            currency = row[currency_index].upper() or spec.default_currency
+
+        amounts = {amount_currency: parse_amount(row[amount_index])}
+        if foreign_amount_index is not None and currency != amount_currency:
+            foreign_amount = parse_amount(row[foreign_amount_index])
+            amounts[currency] = -foreign_amount if spec.negate_foreign_amount else foreign_amount
+
+        yield Transaction(file_id + str(i), to_date(row[date_index]), row[description_index], currency, source_id,
+                          amounts.get('EUR'), amounts.get('USD'), amounts.get('BRL'),
+                          amounts.get(currency) if currency not in CURRENCIES else None)
+
+
+def iter_file(spec: BankCsvSpec, input_file: str) -> Tuple[str, Iterator[Transaction]]:
+    '''Returns the file id and an iterator over the transactions of a bank csv export'''
+    file_id, text = _read(spec, input_file)
+    return file_id, _iter_rows(spec, text, file_id)
+
+
+def extract_file(spec: BankCsvSpec, input_file: str) -> Tuple[str, List[Transaction]]:
+    '''Returns the file id and the transactions of a bank csv export'''
+    file_id, transactions = iter_file(spec, input_file)
+    return file_id, list(transactions)
+
+
+def extract_data(spec: BankCsvSpec, input_file: str) -> List[Transaction]:
+    return extract_file(spec, input_file)[1]
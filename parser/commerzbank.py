@@ -1,43 +1,26 @@
-import argparse
-import csv
-import hashlib
+from . import bank_csv
+from .bank_csv import BankCsvSpec
+from .registry import CsvSignature
+from functools import partial
 
-from datetime import datetime
-from typing import Dict, List, TextIO
 
+SPEC = BankCsvSpec(
+    source_id='commerzbank',
+    encoding='utf-8-sig',
+    delimiter=';',
+    date_column='Buchungstag',
+    date_format='%d.%m.%Y',
+    description_column='Buchungstext',
+    amount_column='Betrag',
+    amount_currency='EUR',
+    number_locale='de',
+    currency_column='Währung'
+)
 
-def _get_source_id() -> str:
-    '''Extracts the source id from the file'''
-    return 'commerzbank'
+SIGNATURE = CsvSignature(header_line=SPEC.skip_lines, delimiter=SPEC.delimiter, columns=('Buchungstag', 'Buchungstext', 'Betrag', 'Währung'))
 
-def _get_file_id(f: TextIO) -> str:
-    '''Extracts the unique id from the file
-    It is used to identify Commerzbank csv files files uniquely to avoid expenses duplication.'''
-    hash_object = hashlib.sha256()
 
-    for chunk in iter(lambda: f.read(4096), ''):
-        hash_object.update(chunk.encode())
-    f.seek(0)
-    return hash_object.hexdigest()[:16]
-
-def extract_data(input_file: str) -> List[Dict[str, str]]:
-    source_id = _get_source_id()
-    transactions = []
-    with open(input_file, 'r', encoding='utf-8-sig') as csvfile:
-        file_id = _get_file_id(csvfile)
-        reader = csv.DictReader(csvfile, delimiter=';')
-
-        i = 1
-        for row in reader:
-            parsed_date = datetime.strptime(row['Buchungstag'], '%d.%m.%Y').date()
-            row_dict = {
-                'id': file_id + str(i),
-                'date': parsed_date.strftime('%Y-%m-%d'),
-                'description': row['Buchungstext'],
-                'amount_eur': float(row['Betrag'].replace(',', '.')),
-                'original_currency': row['Währung'],
-                'source_id': source_id
-            }
-            transactions.append(row_dict)
-            i += 1
-    return transactions
+# The functions every parser module offers, bound to the spec of this export
+iter_file = partial(bank_csv.iter_file, SPEC)
+extract_file = partial(bank_csv.extract_file, SPEC)
+extract_data = partial(bank_csv.extract_data, SPEC)
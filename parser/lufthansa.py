@@ -1,62 +1,30 @@
-import argparse
-import csv
-import hashlib
-import logging
-
-from datetime import datetime
-from typing import Dict, List, TextIO
-
-
-def _get_source_id() -> str:
-    '''Extracts the source id from the file'''
-    return 'Miles & More Gold'
-
-def _get_file_id(f: TextIO) -> str:
-    '''Extracts the unique id from the file
-    It is used to identify Lufthansa csv files uniquely to avoid expenses duplication.'''
-    hash_object = hashlib.sha256()
-
-    for chunk in iter(lambda: f.read(4096), ''):
-        hash_object.update(chunk.encode())
-    f.seek(0)
-    return hash_object.hexdigest()[:16]
-
-def _convert_to_float(amount: str) -> float:
-    return float(amount.replace('.', '').replace(',', '.'))
-
-def extract_data(input_file: str) -> List[Dict[str, str]]:
-    source_id = _get_source_id()
-    transactions = []
-    with open(input_file, 'r') as csvfile:
-        file_id = _get_file_id(csvfile)
-        next(csvfile)
-        next(csvfile)
-        header_line = csvfile.readline()
-        header = header_line.split(';')
-        header[8] = 'Original currency'
-        reader = csv.DictReader(csvfile, delimiter=';', fieldnames=header)
-
-        i = 1
-        for row in reader:
-            if row['Status'] == 'Authorised':
-                logging.warning(f'Row {i} is not Processed. Skipping...')
-                i += 1
-                continue
-            parsed_date = datetime.strptime(row['Authorised on'], '%d.%m.%Y').date()
-            row_dict = {
-                'id': file_id + str(i),
-                'date': parsed_date.strftime('%Y-%m-%d'),
-                'description': row['Description'],
-                'amount_eur': _convert_to_float(row['Amount']),
-                'original_currency': row['Original currency'],
-                'source_id': source_id
-            }
-            if row_dict['original_currency'] == '':
-                row_dict['original_currency'] = 'EUR'
-            if row['Original currency'] == 'USD':
-                row_dict['amount_usd'] = _convert_to_float(row['Amount in foreign currency'])
-            elif row['Original currency'] == 'BRL':
-                row_dict['amount_brl'] = _convert_to_float(row['Amount in foreign currency'])
-            transactions.append(row_dict)
-            i += 1
-    return transactions
\ No newline at end of file
+from . import bank_csv
+from .bank_csv import BankCsvSpec
+from .registry import CsvSignature
+from functools import partial
+
+
+SPEC = BankCsvSpec(
+    source_id='Miles & More Gold',
+    skip_lines=2,
+    delimiter=';',
+    # The export has two 'Currency' columns, the second one is the original currency
+    header_overrides=((8, 'Original currency'),),
+    date_column='Authorised on',
+    date_format='%d.%m.%Y',
+    description_column='Description',
+    amount_column='Amount',
+    amount_currency='EUR',
+    number_locale='de',
+    currency_column='Original currency',
+    foreign_amount_column='Amount in foreign currency',
+    skip_when=('Status', 'Authorised')
+)
+
+SIGNATURE = CsvSignature(header_line=SPEC.skip_lines, delimiter=SPEC.delimiter, columns=('Status', 'Authorised on', 'Description', 'Amount', 'Amount in foreign currency'))
+
+
+# The functions every parser module offers, bound to the spec of this export
+iter_file = partial(bank_csv.iter_file, SPEC)
+extract_file = partial(bank_csv.extract_file, SPEC)
+extract_data = partial(bank_csv.extract_data, SPEC)
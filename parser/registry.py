@@ -0,0 +1,101 @@
+import csv
+import importlib
+
+from profiling.metrics import metrics
+from types import ModuleType
+from typing import List, NamedTuple, Tuple
+
+
+_HEAD_SIZE = 4096
+
+# Ways parser.amex reads the rows of a pdf, kept here so the command line can offer them
+# without importing the pdf libraries
+PDF_EXTRACTION_MODES = ('tables', 'text', 'check')
+
+
+class CsvSignature(NamedTuple):
+    '''Describes how to recognise a csv export from its first lines'''
+    header_line: int
+    delimiter: str
+    columns: Tuple[str, ...]
+    encoding: str = 'utf-8-sig'
+
+    def matches(self, input_file: str, head: bytes) -> bool:
+        lines = head.decode(self.encoding, errors='replace').splitlines()
+        # The last line of the head may be cut in the middle, so it is only used when the file is that short
+        if len(lines) <= self.header_line or (len(head) == _HEAD_SIZE and len(lines) == self.header_line + 1):
+            return False
+        header = next(csv.reader([lines[self.header_line]], delimiter=self.delimiter), [])
+        header = {column.strip() for column in header}
+        return all(column in header for column in self.columns)
+
+
+class PdfSignature(NamedTuple):
+    '''Describes how to recognise a pdf statement from the first line of the text of its first page'''
+    marker: str
+
+    def matches(self, input_file: str, head: bytes) -> bool:
+        if not head.startswith(b'%PDF'):
+            return False
+
+        # pdfium gives the text of the page without laying out its characters like pdfplumber,
+        # which the parser does anyway for the header
+        import pypdfium2 as pdfium
+        document = pdfium.PdfDocument(input_file)
+        try:
+            page = document[0]
+            text_page = page.get_textpage()
+            try:
+                text = text_page.get_text_range()
+            finally:
+                text_page.close()
+                page.close()
+        finally:
+            document.close()
+        lines = text.strip().splitlines()
+        return len(lines) > 0 and self.marker in lines[0]
+
+
+class Format(NamedTuple):
+    name: str
+    extension: str
+    module: str
+
+
+# Parser modules are only imported when a file of their extension shows up
+formats = [
+    Format('amex', '.pdf', 'parser.amex'),
+    Format('commerzbank', '.csv', 'parser.commerzbank'),
+    Format('inter', '.csv', 'parser.inter'),
+    Format('lufthansa', '.csv', 'parser.lufthansa'),
+    Format('n26', '.csv', 'parser.n26'),
+]
+
+
+def get_parser(format: Format) -> ModuleType:
+    return importlib.import_module(format.module)
+
+
+def candidates(extension: str) -> List[Format]:
+    '''Returns the formats that can be stored in files with the extension'''
+    return [f for f in formats if f.extension == extension.lower()]
+
+
+def detect(input_file: str, extension: str) -> Format:
+    '''Finds the single format of the file by looking at its first bytes only.
+    Raises ValueError when no format or more than one format matches.'''
+    with open(input_file, 'rb') as f:
+        head = f.read(_HEAD_SIZE)
+
+    matching = []
+    for f in candidates(extension):
+        with metrics.timer(f'detect.{f.name}'):
+            matches = get_parser(f).SIGNATURE.matches(input_file, head)
+        metrics.add(f'detect.{f.name}.{"matched" if matches else "rejected"}')
+        if matches:
+            matching.append(f)
+    if len(matching) == 0:
+        raise ValueError(f'File does not match any known {extension} format')
+    if len(matching) > 1:
+        raise ValueError(f'File matches several formats: {", ".join(f.name for f in matching)}')
+    return matching[0]
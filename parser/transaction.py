@@ -0,0 +1,45 @@
+from datetime import date
+from typing import NamedTuple, Optional
+
+
+class Transaction(NamedTuple):
+    '''A transaction as read from a statement, the record given by every parser.
+    Amounts are integer cents, so they add up exactly; the amounts a statement does not
+    give are None and are converted from the one in the original currency.
+    An original currency without a field of its own keeps its amount in other_cents.
+    transfer_id is the id of the other side of a transfer between accounts, set once both are linked.'''
+    id: str
+    date: date
+    description: str
+    original_currency: str
+    source_id: str
+    eur_cents: Optional[int] = None
+    usd_cents: Optional[int] = None
+    brl_cents: Optional[int] = None
+    other_cents: Optional[int] = None
+    transfer_id: Optional[str] = None
+
+    def cents(self, currency: str) -> Optional[int]:
+        index = _CENTS_INDEXES.get(currency)
+        if index is not None:
+            return self[index]
+        return self.other_cents if currency == self.original_currency else None
+
+
+_CENTS_INDEXES = {
+    'EUR': Transaction._fields.index('eur_cents'),
+    'USD': Transaction._fields.index('usd_cents'),
+    'BRL': Transaction._fields.index('brl_cents'),
+}
+
+CURRENCIES = tuple(_CENTS_INDEXES)
+
+
+def to_cents(amount: str) -> int:
+    '''Converts a decimal amount such as -1234.56 to cents.
+    Exact for any amount with at most two decimals below trillions.'''
+    return round(float(amount) * 100)
+
+
+def from_cents(cents: int) -> float:
+    return cents / 100
@@ -0,0 +1,64 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from profiling.metrics import metrics
+from typing import Any, Callable, Dict, List, NamedTuple, Sequence
+
+
+class Stage(NamedTuple):
+    name: str
+    function: Callable[..., Any]
+    inputs: Sequence[str]
+    after: Sequence[str]
+
+
+class StageScheduler:
+    '''Runs stages on a pool of threads as soon as the stages they depend on are done,
+    so stages that do not depend on each other overlap. A stage is given the results of its inputs;
+    after only orders it behind other stages. Names sharing a prefix before ':' (parse:0, parse:1)
+    are timed together as stage.<prefix>.'''
+
+    def __init__(self, max_workers: int = 4) -> None:
+        self.max_workers = max_workers
+        self._stages: Dict[str, Stage] = {}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._stages
+
+    def add(self, name: str, function: Callable[..., Any], inputs: Sequence[str] = (), after: Sequence[str] = ()) -> None:
+        if name in self._stages:
+            raise ValueError(f'Stage {name} added twice')
+        for dependency in list(inputs) + list(after):
+            if dependency not in self._stages:
+                raise ValueError(f'Stage {name} depends on {dependency}, which must be added before it')
+        self._stages[name] = Stage(name, function, tuple(inputs), tuple(after))
+
+    def _run_stage(self, stage: Stage, arguments: List[Any]) -> Any:
+        with metrics.timer(f'stage.{stage.name.split(":")[0]}'):
+            return stage.function(*arguments)
+
+    def run(self) -> Dict[str, Any]:
+        '''Runs every stage and returns their results by name.
+        The first stage to fail stops the run: the stages not started yet are dropped and its error is raised.'''
+        results: Dict[str, Any] = {}
+        waiting = dict(self._stages)
+        running: Dict[Future, str] = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='stage') as pool:
+            while len(waiting) > 0 or len(running) > 0:
+                # Stages are added after their dependencies, so this order starts the earliest ones first
+                for name, stage in list(waiting.items()):
+                    if all(dependency in results for dependency in stage.inputs + stage.after):
+                        del waiting[name]
+                        future = pool.submit(self._run_stage, stage, [results[i] for i in stage.inputs])
+                        running[future] = name
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except BaseException:
+                        waiting.clear()
+                        for pending in running:
+                            pending.cancel()
+                        raise
+        return results
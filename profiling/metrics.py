@@ -0,0 +1,97 @@
+import json
+import threading
+import time
+
+from contextlib import contextmanager, nullcontext
+from typing import Any, ContextManager, Dict, Iterator, List
+
+
+_DISABLED = nullcontext()
+
+
+class Metrics:
+    '''Timers and counters filled by the instrumented code paths.
+    Disabled by default: timer then hands back a shared no-op context and add returns at once,
+    so instrumentation costs one attribute check. Code running once per row checks enabled itself.'''
+
+    def __init__(self) -> None:
+        self.enabled = False
+        # name -> [calls, total seconds, max seconds]
+        self.timers: Dict[str, List[float]] = {}
+        self.counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def reset(self) -> None:
+        with self._lock:
+            self.timers = {}
+            self.counters = {}
+
+    def add(self, name: str, value: float = 1) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+
+    @contextmanager
+    def _timed(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def timer(self, name: str) -> ContextManager:
+        if not self.enabled:
+            return _DISABLED
+        return self._timed(name)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'timers': {name: {'calls': int(calls), 'seconds': total, 'max_seconds': longest}
+                           for name, (calls, total, longest) in sorted(self.timers.items())},
+                'counters': dict(sorted(self.counters.items())),
+            }
+
+    def merge(self, snapshot: Dict[str, Any]) -> None:
+        '''Adds the metrics collected by another process'''
+        with self._lock:
+            for name, timer in snapshot['timers'].items():
+                current = self.timers.setdefault(name, [0, 0.0, 0.0])
+                current[0] += timer['calls']
+                current[1] += timer['seconds']
+                current[2] = max(current[2], timer['max_seconds'])
+            for name, value in snapshot['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def print_summary(self) -> None:
+        report = self.snapshot()
+        print(f'{"timer":<40} {"calls":>7} {"total (s)":>10} {"mean (ms)":>10} {"max (ms)":>9}')
+        for name, timer in report['timers'].items():
+            print(f'{name:<40} {timer["calls"]:>7} {timer["seconds"]:>10.3f} '
+                  f'{timer["seconds"] / timer["calls"] * 1000:>10.2f} {timer["max_seconds"] * 1000:>9.2f}')
+        if len(report['counters']) > 0:
+            print(f'{"counter":<40} {"value":>7}')
+            for name, value in report['counters'].items():
+                print(f'{name:<40} {value:>7g}')
+
+    def save(self, path: str) -> None:
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+
+# Shared by every module, enabled by main.py with --profile
+metrics = Metrics()
@@ -0,0 +1,106 @@
+import hashlib
+
+from category.store import normalize_description
+from collections import Counter
+from itertools import islice
+from parser.transaction import Transaction
+from storage.sqlite_state import SqliteState
+from typing import Dict, Iterable, Iterator, List, Set
+
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS fingerprints (
+    fingerprint INTEGER PRIMARY KEY,
+    id TEXT NOT NULL
+);
+'''
+
+# Rows looked up in the index with a single query, below SQLite's limit of variables per statement
+_BATCH_SIZE = 500
+
+
+def fingerprint(t: Transaction, occurrence: int) -> int:
+    '''Identifies a booking independently of the export it comes from.
+    occurrence tells apart identical bookings of the same export, e.g. two coffees on the same day.'''
+    key = '\x1f'.join((t.source_id, t.date.isoformat(), str(t.cents(t.original_currency)), t.original_currency,
+                       normalize_description(t.description), str(occurrence)))
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big', signed=True)
+
+
+class FingerprintIndex(SqliteState):
+    '''Fingerprints of the rows already written to the output, persisted in SQLite.
+    Exports with overlapping dates repeat bookings under different ids, since ids come from the file;
+    their fingerprints are the same, so the repeated rows are dropped.
+    Lookups only touch the fingerprints of the rows being checked, the index is never loaded whole.
+    Rows are only added once written to the output, so rows that could not be written are read again later.'''
+
+    FILE_NAME = 'fingerprints.sqlite'
+    SCHEMA = _SCHEMA
+
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+        # Fingerprints of the rows written in this run, until save
+        self._pending: Dict[int, str] = {}
+        # Fingerprints of the rows passed through and not written yet, still dropped when repeated in the run
+        self._unwritten: Dict[int, str] = {}
+        # Set by clear until save empties the table
+        self._cleared = False
+        self.duplicates = 0
+
+    def clear(self) -> None:
+        '''Empties the index for an output written from scratch. The fingerprints on disk are only
+        deleted by save, so a run that stops before keeps those of the previous output.'''
+        self._cleared = True
+        self._pending = {}
+        self._unwritten = {}
+
+    def _known(self, fingerprints: List[int]) -> Set[int]:
+        known = {f for f in fingerprints if f in self._pending or f in self._unwritten}
+        if self._cleared:
+            return known
+        cursor = self._connection.execute(
+            f'SELECT fingerprint FROM fingerprints WHERE fingerprint IN ({",".join("?" * len(fingerprints))})', fingerprints)
+        return known | {row[0] for row in cursor}
+
+    def filter(self, rows: Iterable[Transaction]) -> Iterator[Transaction]:
+        '''Passes through the rows of one export that are not in the index.
+        They are added to it by add once written.'''
+        occurrences: Counter = Counter()
+        iterator = iter(rows)
+        while True:
+            batch = list(islice(iterator, _BATCH_SIZE))
+            if len(batch) == 0:
+                return
+
+            fingerprints = []
+            for t in batch:
+                key = (t.date, t.cents(t.original_currency), t.original_currency, normalize_description(t.description))
+                occurrences[key] += 1
+                fingerprints.append(fingerprint(t, occurrences[key]))
+
+            known = self._known(fingerprints)
+            for t, f in zip(batch, fingerprints):
+                if f in known:
+                    self.duplicates += 1
+                    continue
+                self._unwritten[f] = t.id
+                yield t
+
+    def add(self, rows: Iterable[Transaction]) -> None:
+        '''Adds the rows written to the output, passed through filter before'''
+        fingerprints = {row_id: f for f, row_id in self._unwritten.items()}
+        for t in rows:
+            f = fingerprints.get(t.id)
+            if f is not None:
+                self._pending[f] = self._unwritten.pop(f)
+
+    def save(self) -> None:
+        '''Saves the fingerprints of the rows written. Rows passed through and not written are forgotten.'''
+        with self._connection:
+            if self._cleared:
+                self._connection.execute('DELETE FROM fingerprints')
+            self._connection.executemany('INSERT OR IGNORE INTO fingerprints (fingerprint, id) VALUES (?, ?)',
+                                         self._pending.items())
+        self._pending = {}
+        self._unwritten = {}
+        self._cleared = False
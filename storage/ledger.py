@@ -0,0 +1,62 @@
+import json
+import os
+
+from typing import Dict, Optional
+
+
+class IngestionLedger:
+    '''Persistent record of the statement files already written to the output.
+    Statements are keyed by the file id computed by their parser, with their row count.
+    The size and modification time of each path are kept to skip unchanged files before parsing them.'''
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.files: Dict[str, Dict] = {}
+        self.paths: Dict[str, Dict] = {}
+
+    @classmethod
+    def load(cls, path: str) -> 'IngestionLedger':
+        ledger = cls(path)
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                content = json.load(f)
+            ledger.files = content['files']
+            ledger.paths = content['paths']
+        return ledger
+
+    def save(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as f:
+            json.dump({'files': self.files, 'paths': self.paths}, f, indent=2)
+        os.replace(temporary_path, self.path)
+
+    def is_unchanged(self, file: str) -> bool:
+        '''Tells whether the file was ingested before and has not changed since, without reading it'''
+        entry = self.paths.get(os.path.abspath(file))
+        if entry is None or entry['file_id'] not in self.files:
+            return False
+        stat = os.stat(file)
+        return entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime
+
+    def contains(self, file_id: str) -> bool:
+        return file_id in self.files
+
+    def record(self, file_id: str, file: str, rows: Optional[int] = None) -> None:
+        '''Records the file as ingested. When rows is not given the previous row count is kept.'''
+        if rows is not None or file_id not in self.files:
+            self.files[file_id] = {'rows': rows or 0}
+
+        stat = os.stat(file)
+        self.paths[os.path.abspath(file)] = {
+            'file_id': file_id,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+        }
+
+    def forget(self, file_id: str) -> None:
+        '''Removes the file, so the next run reads it again. Used when some of its rows could not be written.'''
+        self.files.pop(file_id, None)
+        self.paths = {path: entry for path, entry in self.paths.items() if entry['file_id'] != file_id}
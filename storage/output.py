@@ -0,0 +1,213 @@
+import csv
+import os
+import sqlite3
+
+from contextlib import contextmanager
+from datetime import date
+from parser.transaction import Transaction, from_cents, to_cents
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+
+CSV_FIELDS = ['id', 'date', 'category', 'description', 'amount_eur', 'amount_usd', 'amount_brl', 'original_currency', 'source_id',
+              'transfer_id']
+
+_SQLITE_PREFIX = 'sqlite:'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS transactions (
+    id TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    category TEXT,
+    description TEXT NOT NULL,
+    eur_cents INTEGER,
+    usd_cents INTEGER,
+    brl_cents INTEGER,
+    original_currency TEXT NOT NULL,
+    source_id TEXT NOT NULL,
+    transfer_id TEXT
+);
+CREATE INDEX IF NOT EXISTS transactions_date ON transactions (date);
+CREATE INDEX IF NOT EXISTS transactions_category ON transactions (category);
+CREATE INDEX IF NOT EXISTS transactions_source_id ON transactions (source_id);
+'''
+
+_UPSERT = '''
+INSERT INTO transactions (id, date, category, description, eur_cents, usd_cents, brl_cents, original_currency, source_id,
+                          transfer_id)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    date = excluded.date,
+    category = excluded.category,
+    description = excluded.description,
+    eur_cents = excluded.eur_cents,
+    usd_cents = excluded.usd_cents,
+    brl_cents = excluded.brl_cents,
+    original_currency = excluded.original_currency,
+    source_id = excluded.source_id,
+    transfer_id = excluded.transfer_id
+'''
+
+# A categorized transaction with the amounts in every output currency
+Row = Tuple[Transaction, Optional[str]]
+
+
+def output_path(output: str) -> str:
+    '''Returns the file written by the output, given as a csv path or as sqlite:PATH'''
+    return output[len(_SQLITE_PREFIX):] if output.startswith(_SQLITE_PREFIX) else output
+
+
+def _csv_header(path: str) -> List[str]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return next(csv.reader(f), CSV_FIELDS)
+
+
+def _mark_transfers(path: str, transfer_ids: Dict[str, str]) -> None:
+    '''Rewrites the csv file with the transfer_id of the rows given by id, adding the column when the file has none'''
+    temporary_path = path + '.tmp'
+    with open(path, 'r', encoding='utf-8') as source, open(temporary_path, 'w') as target:
+        reader = csv.DictReader(source)
+        fields = list(reader.fieldnames or CSV_FIELDS)
+        if 'transfer_id' not in fields:
+            fields.append('transfer_id')
+        writer = csv.DictWriter(target, fieldnames=fields)
+        writer.writeheader()
+        for row in reader:
+            transfer_id = transfer_ids.get(row['id'])
+            if transfer_id is not None:
+                row['transfer_id'] = transfer_id
+            writer.writerow(row)
+    os.replace(temporary_path, path)
+
+
+class CsvOutput:
+    '''Writes the rows to a csv file, appending to it or rewriting it with a header.
+    Rows appended to a file written before a column was added keep the columns of its header.
+
+    Rows already in the file that become one side of a transfer cannot be updated in place, so they
+    are marked when the output is closed, rewriting the file once. A file without the transfer_id
+    column gets it then, with the transfer_id of the rows appended in this run.'''
+
+    def __init__(self, path: str, appending: bool) -> None:
+        self._path = path
+        fields = _csv_header(path) if appending and os.path.getsize(path) > 0 else CSV_FIELDS
+        self._file = open(path, 'a' if appending else 'w')
+        self._writer = csv.DictWriter(self._file, fieldnames=fields, extrasaction='ignore')
+        if not appending:
+            self._writer.writeheader()
+        self._has_transfer_id = 'transfer_id' in fields
+        # transfer_id of the rows to mark when the file is closed, by id
+        self._transfer_ids: Dict[str, str] = {}
+
+    def write(self, rows: List[Row]) -> None:
+        for t, category in rows:
+            self._writer.writerow({
+                'id': t.id,
+                'date': t.date.isoformat(),
+                'category': category,
+                'description': t.description,
+                'amount_eur': from_cents(t.eur_cents),
+                'amount_usd': from_cents(t.usd_cents),
+                'amount_brl': from_cents(t.brl_cents),
+                'original_currency': t.original_currency,
+                'source_id': t.source_id,
+                'transfer_id': t.transfer_id
+            })
+            if t.transfer_id is not None and not self._has_transfer_id:
+                self._transfer_ids[t.id] = t.transfer_id
+
+    def link(self, links: List[Tuple[str, str]]) -> None:
+        '''Marks rows written before as one side of a transfer, given as (id, id of the other side)'''
+        self._transfer_ids.update(links)
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+        if len(self._transfer_ids) > 0:
+            _mark_transfers(self._path, self._transfer_ids)
+            self._transfer_ids = {}
+
+
+class SqliteOutput:
+    '''Upserts the rows by id into the transactions table of a SQLite database.
+    Amounts are kept in cents, and dates as ISO strings so they sort and compare as dates.'''
+
+    def __init__(self, path: str, appending: bool) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript(_SCHEMA)
+        columns = {row[1] for row in self._connection.execute('PRAGMA table_info(transactions)')}
+        if 'transfer_id' not in columns:
+            # Databases written before transfers were linked
+            self._connection.execute('ALTER TABLE transactions ADD COLUMN transfer_id TEXT')
+        if not appending:
+            with self._connection:
+                self._connection.execute('DELETE FROM transactions')
+
+    def write(self, rows: List[Row]) -> None:
+        # Every call is written in a single transaction
+        with self._connection:
+            self._connection.executemany(_UPSERT, [
+                (t.id, t.date.isoformat(), category, t.description, t.eur_cents, t.usd_cents, t.brl_cents,
+                 t.original_currency, t.source_id, t.transfer_id)
+                for t, category in rows])
+
+    def link(self, links: List[Tuple[str, str]]) -> None:
+        '''Marks rows written before as one side of a transfer, given as (id, id of the other side)'''
+        with self._connection:
+            self._connection.executemany('UPDATE transactions SET transfer_id = ? WHERE id = ?',
+                                         [(other, row_id) for row_id, other in links])
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+Output = Union[CsvOutput, SqliteOutput]
+
+
+@contextmanager
+def open_output(output: str, appending: bool) -> Iterator[Output]:
+    '''Opens the output given as a csv path or as sqlite:PATH, closing it once done'''
+    if output.startswith(_SQLITE_PREFIX):
+        opened = SqliteOutput(output_path(output), appending)
+    else:
+        opened = CsvOutput(output, appending)
+    try:
+        yield opened
+    finally:
+        opened.close()
+
+
+def read_output(path: str) -> Iterator[Row]:
+    '''Yields the rows of an output, either a csv file or a SQLite database'''
+    with open(path, 'rb') as f:
+        is_sqlite = f.read(16) == b'SQLite format 3\x00'
+
+    if is_sqlite:
+        connection = sqlite3.connect(path)
+        try:
+            columns = {row[1] for row in connection.execute('PRAGMA table_info(transactions)')}
+            transfer_id = 'transfer_id' if 'transfer_id' in columns else 'NULL'
+            cursor = connection.execute('SELECT id, date, description, original_currency, source_id, eur_cents, usd_cents, '
+                                        f'brl_cents, category, {transfer_id} FROM transactions')
+            for row in cursor:
+                yield Transaction(row[0], date.fromisoformat(row[1]), *row[2:8], transfer_id=row[9]), row[8]
+        finally:
+            connection.close()
+        return
+
+    def cents(amount: str) -> Optional[int]:
+        return to_cents(amount) if amount else None
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            t = Transaction(row['id'], date.fromisoformat(row['date']), row['description'], row['original_currency'],
+                            row['source_id'], cents(row['amount_eur']), cents(row['amount_usd']), cents(row['amount_brl']),
+                            transfer_id=row.get('transfer_id') or None)
+            yield t, row['category'] or None
@@ -0,0 +1,121 @@
+from parser.transaction import Transaction
+from storage.sqlite_state import SqliteState
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS monthly (
+    month TEXT NOT NULL,
+    category TEXT NOT NULL,
+    source_id TEXT NOT NULL,
+    currency TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    eur_cents INTEGER NOT NULL,
+    usd_cents INTEGER NOT NULL,
+    brl_cents INTEGER NOT NULL,
+    PRIMARY KEY (month, category, source_id, currency)
+);
+'''
+
+_ADD = '''
+INSERT INTO monthly (month, category, source_id, currency, count, eur_cents, usd_cents, brl_cents)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (month, category, source_id, currency) DO UPDATE SET
+    count = count + excluded.count,
+    eur_cents = eur_cents + excluded.eur_cents,
+    usd_cents = usd_cents + excluded.usd_cents,
+    brl_cents = brl_cents + excluded.brl_cents
+'''
+
+# Columns a report can be grouped by, and the currencies its amounts can be given in
+DIMENSIONS = ('month', 'category', 'source_id', 'currency')
+AMOUNT_COLUMNS = {'EUR': 'eur_cents', 'USD': 'usd_cents', 'BRL': 'brl_cents'}
+
+# Marks a store that holds every row of the output, in SQLite's user_version
+_COMPLETE = 1
+
+# (month, category, source_id, currency) -> [count, eur_cents, usd_cents, brl_cents]
+Totals = Dict[Tuple[str, str, str, str], List[int]]
+
+
+class RollupStore(SqliteState):
+    '''Count and sums in every output currency of the rows written to the output, per month, category,
+    source and original currency, persisted in SQLite.
+    New rows are grouped in memory and added to the totals of their groups when saved, so only the
+    months they fall in are touched and reports never read the transactions.'''
+
+    FILE_NAME = 'rollups.sqlite'
+    SCHEMA = _SCHEMA
+
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+        # Totals of the rows written in this run, until save
+        self._pending: Totals = {}
+        # Set by clear until save empties the table
+        self._cleared = False
+
+    def is_complete(self) -> bool:
+        '''Tells whether the totals cover the whole output, which a store created next to an existing output does not'''
+        return self._connection.execute('PRAGMA user_version').fetchone()[0] == _COMPLETE
+
+    def clear(self) -> None:
+        '''Empties the store for an output written from scratch. The totals on disk are only replaced,
+        and the store marked complete, by save, so a run that stops before keeps those of the previous output.'''
+        self._cleared = True
+        self._pending = {}
+
+    def rebuild(self, rows: Iterable[Tuple[Transaction, Optional[str]]]) -> None:
+        '''Replaces the totals with those of all the rows of the output'''
+        self.clear()
+        self.add(rows)
+        self.save()
+
+    def add(self, rows: Iterable[Tuple[Transaction, Optional[str]]]) -> None:
+        pending = self._pending
+        for t, category in rows:
+            key = (t.date.isoformat()[:7], category or '', t.source_id, t.original_currency)
+            totals = pending.get(key)
+            if totals is None:
+                totals = pending[key] = [0, 0, 0, 0]
+            totals[0] += 1
+            totals[1] += t.eur_cents or 0
+            totals[2] += t.usd_cents or 0
+            totals[3] += t.brl_cents or 0
+
+    def save(self) -> int:
+        '''Adds the pending totals to the store and returns the number of months they touched'''
+        months = {key[0] for key in self._pending}
+        with self._connection:
+            if self._cleared:
+                self._connection.execute('DELETE FROM monthly')
+                # In the same transaction as the totals, user_version being part of the database header
+                self._connection.execute(f'PRAGMA user_version = {_COMPLETE}')
+            self._connection.executemany(_ADD, [key + tuple(totals) for key, totals in self._pending.items()])
+        self._pending = {}
+        self._cleared = False
+        return len(months)
+
+    def query(self, by: Sequence[str], currency: str = 'EUR', start_month: Optional[str] = None,
+              end_month: Optional[str] = None) -> List[Tuple]:
+        '''Returns the count and sum in currency of the rows per group of the by columns,
+        over the months between start_month and end_month (YYYY-MM, inclusive)'''
+        if any(column not in DIMENSIONS for column in by):
+            raise ValueError(f'Reports can only be grouped by {", ".join(DIMENSIONS)}')
+        if currency not in AMOUNT_COLUMNS:
+            raise ValueError(f'Unsupported report currency {currency}')
+
+        conditions, parameters = [], []
+        if start_month is not None:
+            conditions.append('month >= ?')
+            parameters.append(start_month)
+        if end_month is not None:
+            conditions.append('month <= ?')
+            parameters.append(end_month)
+
+        columns = ', '.join(by)
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        group = f'GROUP BY {columns} ORDER BY {columns}' if by else ''
+        select = f'{columns}, ' if by else ''
+        cursor = self._connection.execute(
+            f'SELECT {select}SUM(count), SUM({AMOUNT_COLUMNS[currency]}) FROM monthly {where} {group}', parameters)
+        return [row for row in cursor.fetchall() if row[-2] is not None]
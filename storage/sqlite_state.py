@@ -0,0 +1,39 @@
+import os
+import sqlite3
+
+from typing import Type, TypeVar
+
+
+StoreType = TypeVar('StoreType', bound='SqliteState')
+
+
+def connect(path: str, schema: str) -> sqlite3.Connection:
+    '''Opens a SQLite database, creating its directory and the tables of the schema.
+    The connection is not bound to the thread that opened it: stores are used by one pipeline stage
+    at a time, and that stage may run on any thread.'''
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.executescript(schema)
+    return connection
+
+
+class SqliteState:
+    '''Base of the stores kept in a SQLite database of the state dir.
+    Stores that follow the output keep the changes of a run in memory until save, which is only called
+    together with the save of the ledger once the output is written. The state on disk then never
+    describes rows the output does not have, whatever point a run stopped at.'''
+
+    FILE_NAME = ''
+    SCHEMA = ''
+
+    def __init__(self, path: str) -> None:
+        self._connection = connect(path, self.SCHEMA)
+
+    @classmethod
+    def in_state_dir(cls: Type[StoreType], state_dir: str, *args, **kwargs) -> StoreType:
+        return cls(os.path.join(state_dir, cls.FILE_NAME), *args, **kwargs)
+
+    def close(self) -> None:
+        self._connection.close()
@@ -0,0 +1,57 @@
+import os
+
+from category.store import CategoryStore
+from storage.fingerprints import FingerprintIndex
+from storage.ledger import IngestionLedger
+from storage.rollups import RollupStore
+from storage.transfers import TransferIndex
+
+
+def ledger_path(state_dir: str) -> str:
+    return os.path.join(state_dir, 'ledger.json')
+
+
+class RunState:
+    '''What the state dir records about the output: the files ingested, the fingerprints, totals and open
+    transfers of the rows written, and the categories of the descriptions seen.
+    The stages of a run update it in memory, and save persists it once the rows are written to the output.
+    appending tells whether the output is appended to, or written from scratch with empty stores.'''
+
+    def __init__(self, ledger: IngestionLedger, fingerprints: FingerprintIndex, rollups: RollupStore,
+                 transfers: TransferIndex, categories: CategoryStore, appending: bool) -> None:
+        self.ledger = ledger
+        self.fingerprints = fingerprints
+        self.rollups = rollups
+        self.transfers = transfers
+        self.categories = categories
+        self.appending = appending
+
+    @classmethod
+    def open(cls, state_dir: str, appending: bool, transfer_window: int = 3, transfer_tolerance: float = 0.02) -> 'RunState':
+        '''Opens the stores of the state dir, empty when the output is not appended to'''
+        path = ledger_path(state_dir)
+        ledger = IngestionLedger.load(path) if appending else IngestionLedger(path)
+        state = cls(ledger, FingerprintIndex.in_state_dir(state_dir), RollupStore.in_state_dir(state_dir),
+                    TransferIndex.in_state_dir(state_dir, transfer_window, transfer_tolerance),
+                    CategoryStore.in_state_dir(state_dir), appending)
+        if not appending:
+            state.clear()
+        return state
+
+    def clear(self) -> None:
+        '''Empties the stores that describe the rows of the output. Until save they only look empty,
+        so a run stopping before it rewrites the output leaves the state of the previous output on disk.'''
+        self.fingerprints.clear()
+        self.rollups.clear()
+        self.transfers.clear()
+
+    def save(self) -> None:
+        '''Saves the record of what the output contains, once the rows are written'''
+        self.ledger.save()
+        self.fingerprints.save()
+        self.rollups.save()
+        self.transfers.save()
+
+    def close(self) -> None:
+        for store in (self.fingerprints, self.rollups, self.transfers, self.categories):
+            store.close()
@@ -0,0 +1,181 @@
+from bisect import bisect_left
+from parser.transaction import Transaction
+from storage.output import Row
+from storage.sqlite_state import SqliteState
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS open_rows (
+    id TEXT PRIMARY KEY,
+    source_id TEXT NOT NULL,
+    ordinal INTEGER NOT NULL,
+    currency TEXT NOT NULL,
+    cents INTEGER NOT NULL,
+    eur_cents INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS open_rows_ordinal ON open_rows (ordinal);
+'''
+
+
+class _Entry(NamedTuple):
+    id: str
+    source_id: str
+    ordinal: int
+    currency: str
+    cents: int
+    eur_cents: int
+    new: bool
+
+
+def _entry(t: Transaction) -> Optional[_Entry]:
+    cents = t.cents(t.original_currency)
+    if cents is None or cents == 0 or t.eur_cents is None:
+        return None
+    return _Entry(t.id, t.source_id, t.date.toordinal(), t.original_currency, cents, t.eur_cents, True)
+
+
+class TransferIndex(SqliteState):
+    '''Links the two sides of money moved between accounts: an outflow of one source and an inflow of
+    another, of the same amount, at most window_days apart. Card bill settlements pair the same way
+    with the payment booked on the card account.
+
+    Rows in the same original currency must match to the cent. Rows in different currencies are compared
+    by their EUR amounts, already converted by ConverterSelector, within a relative tolerance for the
+    rates the banks applied. Inflows are kept in buckets per exact amount ordered by date, and in buckets
+    per day ordered by EUR amount, so each outflow only looks at the candidates a bisection gives.
+
+    Rows left without a match are persisted in SQLite, so a transfer is linked when its other side
+    comes in a later export.'''
+
+    FILE_NAME = 'transfers.sqlite'
+    SCHEMA = _SCHEMA
+
+    def __init__(self, path: str, window_days: int = 3, tolerance: float = 0.02) -> None:
+        super().__init__(path)
+        self.window_days = window_days
+        self.tolerance = tolerance
+        # Rows of this run left open and earlier rows linked since, until save
+        self._pending: Dict[str, _Entry] = {}
+        self._closed: Set[str] = set()
+        # Set by clear until save empties the table
+        self._cleared = False
+        self.linked = 0
+
+    def clear(self) -> None:
+        '''Forgets the open rows for an output written from scratch. They are only deleted on disk by save,
+        so a run that stops before keeps those of the previous output.'''
+        self._cleared = True
+        self._pending = {}
+        self._closed = set()
+
+    def _open_entries(self, first_ordinal: int, last_ordinal: int) -> List[_Entry]:
+        '''Returns the rows of earlier batches still without a match between the two days'''
+        entries = []
+        if not self._cleared:
+            cursor = self._connection.execute(
+                'SELECT id, source_id, ordinal, currency, cents, eur_cents FROM open_rows WHERE ordinal BETWEEN ? AND ?',
+                (first_ordinal, last_ordinal))
+            entries = [_Entry(*row, False) for row in cursor if row[0] not in self._closed]
+        entries += [e._replace(new=False) for e in self._pending.values() if first_ordinal <= e.ordinal <= last_ordinal]
+        return entries
+
+    def _match(self, entries: List[_Entry]) -> List[Tuple[_Entry, _Entry]]:
+        '''Pairs outflows with inflows, each row at most once and always with at least one new row of the pair'''
+        window = self.window_days
+        outflows = sorted((e for e in entries if e.cents < 0), key=lambda e: e.ordinal)
+        inflows = sorted((e for e in entries if e.cents > 0), key=lambda e: e.ordinal)
+        linked: Set[str] = set()
+        pairs = []
+
+        def pick(outflow: _Entry, candidates: Iterable[_Entry]) -> Optional[_Entry]:
+            best = None
+            for inflow in candidates:
+                if (inflow.id in linked or inflow.source_id == outflow.source_id or not (inflow.new or outflow.new)
+                        or abs(inflow.ordinal - outflow.ordinal) > window):
+                    continue
+                if best is None or abs(inflow.ordinal - outflow.ordinal) < abs(best.ordinal - outflow.ordinal):
+                    best = inflow
+            return best
+
+        # Same currency: buckets of inflows per exact amount, searched by date
+        buckets: Dict[Tuple[str, int], Tuple[List[int], List[_Entry]]] = {}
+        for inflow in inflows:
+            ordinals, bucket = buckets.setdefault((inflow.currency, inflow.cents), ([], []))
+            ordinals.append(inflow.ordinal)
+            bucket.append(inflow)
+        for outflow in outflows:
+            found = buckets.get((outflow.currency, -outflow.cents))
+            if found is None:
+                continue
+            ordinals, bucket = found
+            start = bisect_left(ordinals, outflow.ordinal - window)
+            end = bisect_left(ordinals, outflow.ordinal + window + 1)
+            inflow = pick(outflow, bucket[start:end])
+            if inflow is not None:
+                linked.update((outflow.id, inflow.id))
+                pairs.append((outflow, inflow))
+
+        # Different currencies: inflows per day sorted by EUR amount, searched within the tolerance
+        days: Dict[int, Tuple[List[int], List[_Entry]]] = {}
+        for inflow in sorted((e for e in inflows if e.id not in linked), key=lambda e: e.eur_cents):
+            amounts, day = days.setdefault(inflow.ordinal, ([], []))
+            amounts.append(inflow.eur_cents)
+            day.append(inflow)
+        for outflow in outflows:
+            if outflow.id in linked:
+                continue
+            amount = -outflow.eur_cents
+            candidates = []
+            for ordinal in range(outflow.ordinal - window, outflow.ordinal + window + 1):
+                amounts, day = days.get(ordinal, ([], []))
+                start = bisect_left(amounts, amount * (1 - self.tolerance))
+                end = bisect_left(amounts, amount * (1 + self.tolerance) + 1)
+                candidates += (e for e in day[start:end] if e.currency != outflow.currency)
+            inflow = pick(outflow, candidates)
+            if inflow is not None:
+                linked.update((outflow.id, inflow.id))
+                pairs.append((outflow, inflow))
+        return pairs
+
+    def link(self, rows: List[Row]) -> Tuple[List[Row], List[Tuple[str, str]]]:
+        '''Sets the transfer_id of the new rows that are one side of a transfer to the id of the other side.
+        Returns the rows and the links from earlier rows, already in the output, to new ones.'''
+        new_entries = [e for e in (_entry(t) for t, _ in rows) if e is not None]
+        if self.window_days <= 0 or len(new_entries) == 0:
+            return rows, []
+
+        first_ordinal = min(e.ordinal for e in new_entries) - self.window_days
+        last_ordinal = max(e.ordinal for e in new_entries) + self.window_days
+        pairs = self._match(new_entries + self._open_entries(first_ordinal, last_ordinal))
+        self.linked += len(pairs)
+
+        transfer_ids: Dict[str, str] = {}
+        earlier_links = []
+        for a, b in pairs:
+            transfer_ids[a.id] = b.id
+            transfer_ids[b.id] = a.id
+            for entry, other in ((a, b), (b, a)):
+                if not entry.new:
+                    earlier_links.append((entry.id, other.id))
+                    self._closed.add(entry.id)
+                    self._pending.pop(entry.id, None)
+
+        for e in new_entries:
+            if e.id not in transfer_ids:
+                self._pending[e.id] = e._replace(new=False)
+        linked_rows = [(t._replace(transfer_id=transfer_ids[t.id]), category) if t.id in transfer_ids else (t, category)
+                       for t, category in rows]
+        return linked_rows, earlier_links
+
+    def save(self) -> None:
+        with self._connection:
+            if self._cleared:
+                self._connection.execute('DELETE FROM open_rows')
+            self._connection.executemany('DELETE FROM open_rows WHERE id = ?', [(i,) for i in self._closed])
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO open_rows (id, source_id, ordinal, currency, cents, eur_cents) VALUES (?, ?, ?, ?, ?, ?)',
+                [e[:6] for e in self._pending.values()])
+        self._pending = {}
+        self._closed = set()
+        self._cleared = False
@@ -0,0 +1,132 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+from typing import Dict, List, Optional, Set, Tuple
+
+
+# From <sys/inotify.h>
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_Q_OVERFLOW = 0x00004000
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def _inotify_fd(folder: str) -> Optional[int]:
+    '''Returns an inotify descriptor watching the files written or moved into the folder,
+    or None where inotify is not available'''
+    library = ctypes.util.find_library('c')
+    if library is None:
+        return None
+    try:
+        libc = ctypes.CDLL(library, use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(folder), _IN_CLOSE_WRITE | _IN_MOVED_TO) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+class FolderWatcher:
+    '''Waits for files to be dropped in a folder, with inotify or by polling where it is not available.
+    Files are reported once complete: inotify tells when a file is closed after writing or moved in,
+    polling waits until its size and modification time stay the same for one interval.
+    A burst of files is returned as one batch once the folder is quiet for settle seconds.'''
+
+    def __init__(self, folder: str, settle: float = 0.2, poll_interval: float = 0.25, use_inotify: bool = True) -> None:
+        self.folder = folder
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self._fd = _inotify_fd(folder) if use_inotify else None
+        # Polling: size and modification time of each file when it was last reported and when last seen
+        self._reported = self._scan()
+        self._seen = dict(self._reported)
+
+    @property
+    def uses_inotify(self) -> bool:
+        return self._fd is not None
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _scan(self) -> Dict[str, Tuple[int, float]]:
+        files = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    stat = entry.stat()
+                    files[entry.path] = (stat.st_size, stat.st_mtime)
+        return files
+
+    def _read_events(self) -> Set[str]:
+        names = set()
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                return names
+            position = 0
+            while position < len(data):
+                _, mask, _, length = _EVENT_HEADER.unpack_from(data, position)
+                position += _EVENT_HEADER.size
+                name = data[position:position + length].rstrip(b'\0')
+                position += length
+                if mask & _IN_Q_OVERFLOW:
+                    # Events were lost, every file is looked at again
+                    names.update(os.path.basename(path) for path in self._scan())
+                elif name:
+                    names.add(os.fsdecode(name))
+
+    def _wait_inotify(self, timeout: Optional[float]) -> List[str]:
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if len(ready) == 0:
+            return []
+        names = self._read_events()
+        # Keep collecting until no event arrives for settle seconds
+        while len(select.select([self._fd], [], [], self.settle)[0]) > 0:
+            names |= self._read_events()
+        paths = (os.path.join(self.folder, name) for name in names)
+        return sorted(path for path in paths if os.path.isfile(path))
+
+    def _wait_polling(self, timeout: Optional[float]) -> List[str]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        ready: Set[str] = set()
+        quiet_since = time.monotonic()
+        while True:
+            time.sleep(self.poll_interval)
+            current = self._scan()
+            changing = False
+            for path, stat in current.items():
+                if stat == self._reported.get(path):
+                    continue
+                if stat == self._seen.get(path):
+                    ready.add(path)
+                else:
+                    changing = True
+            self._seen = current
+
+            now = time.monotonic()
+            if changing:
+                quiet_since = now
+            elif len(ready) > 0 and now - quiet_since >= self.settle:
+                for path in ready:
+                    self._reported[path] = current[path]
+                return sorted(ready)
+            if deadline is not None and now >= deadline and len(ready) == 0 and not changing:
+                return []
+
+    def wait(self, timeout: Optional[float] = None) -> List[str]:
+        '''Blocks until new or changed files are complete and returns their paths,
+        or an empty list when nothing arrived within timeout seconds'''
+        if self._fd is not None:
+            return self._wait_inotify(timeout)
+        return self._wait_polling(timeout)
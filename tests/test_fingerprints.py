@@ -0,0 +1,52 @@
+from datetime import date
+from parser.transaction import Transaction
+from storage.fingerprints import FingerprintIndex
+
+
+def _transaction(id: str, description: str = 'REWE Markt 1234', cents: int = -1250, day: int = 3) -> Transaction:
+    return Transaction(id, date(2024, 5, day), description, 'EUR', 'n26', eur_cents=cents)
+
+
+def test_drops_rows_written_by_another_export(tmp_path):
+    index = FingerprintIndex.in_state_dir(str(tmp_path))
+    rows = list(index.filter([_transaction('a1'), _transaction('a2', 'Bakery', -300)]))
+    index.add(rows)
+    index.save()
+    index.close()
+
+    index = FingerprintIndex.in_state_dir(str(tmp_path))
+    # The same bookings in an overlapping export, with other ids and another store number
+    overlapping = [_transaction('b1', 'REWE MARKT 5678'), _transaction('b2', 'Bakery', -300), _transaction('b3', 'Kiosk', -200)]
+    assert [t.id for t in index.filter(overlapping)] == ['b3']
+    assert index.duplicates == 2
+
+
+def test_keeps_identical_bookings_of_the_same_export(tmp_path):
+    index = FingerprintIndex.in_state_dir(str(tmp_path))
+    assert [t.id for t in index.filter([_transaction('a1'), _transaction('a2')])] == ['a1', 'a2']
+    assert index.duplicates == 0
+
+
+def test_forgets_rows_that_were_not_written(tmp_path):
+    index = FingerprintIndex.in_state_dir(str(tmp_path))
+    written, unwritten = list(index.filter([_transaction('a1'), _transaction('a2', 'Bakery', -300)]))
+    index.add([written])
+    index.save()
+
+    assert [t.id for t in index.filter([_transaction('b1'), _transaction('b2', 'Bakery', -300)])] == ['b2']
+
+
+def test_clear_only_empties_the_table_on_save(tmp_path):
+    index = FingerprintIndex.in_state_dir(str(tmp_path))
+    index.add(list(index.filter([_transaction('a1')])))
+    index.save()
+
+    index.clear()
+    assert [t.id for t in index.filter([_transaction('b1')])] == ['b1']
+    index.close()
+
+    index = FingerprintIndex.in_state_dir(str(tmp_path))
+    assert list(index.filter([_transaction('c1')])) == []
+    index.clear()
+    index.save()
+    assert [t.id for t in index.filter([_transaction('d1')])] == ['d1']
@@ -0,0 +1,60 @@
+from datetime import date
+from parser.transaction import Transaction
+from storage.output import CsvOutput, read_output
+from storage.rollups import RollupStore
+
+
+def _row(id: str, day: date, category: str, eur_cents: int):
+    return Transaction(id, day, 'Shop', 'EUR', 'n26', eur_cents, eur_cents, eur_cents * 6), category
+
+
+ROWS = [
+    _row('a', date(2024, 1, 5), 'Groceries', -1000),
+    _row('b', date(2024, 1, 20), 'Groceries', -500),
+    _row('c', date(2024, 2, 1), 'Rent', -90000),
+]
+
+
+def test_adds_the_rows_per_month_and_category(tmp_path):
+    store = RollupStore.in_state_dir(str(tmp_path))
+    store.add(ROWS[:2])
+    store.save()
+    store.add(ROWS[2:])
+    assert store.save() == 1
+
+    assert store.query(['month', 'category']) == [('2024-01', 'Groceries', 2, -1500), ('2024-02', 'Rent', 1, -90000)]
+    assert store.query([], 'BRL', start_month='2024-02') == [(1, -540000)]
+
+
+def test_rebuilds_from_the_output(tmp_path):
+    path = str(tmp_path / 'output.csv')
+    output = CsvOutput(path, appending=False)
+    output.write(ROWS)
+    output.close()
+
+    store = RollupStore.in_state_dir(str(tmp_path))
+    assert not store.is_complete()
+    store.add(ROWS[:1])
+    store.save()
+
+    store.rebuild(read_output(path))
+    assert store.is_complete()
+    assert store.query(['category']) == [('Groceries', 2, -1500), ('Rent', 1, -90000)]
+
+
+def test_clear_only_replaces_the_totals_on_save(tmp_path):
+    store = RollupStore.in_state_dir(str(tmp_path))
+    store.add(ROWS)
+    store.save()
+
+    store.clear()
+    store.close()
+    store = RollupStore.in_state_dir(str(tmp_path))
+    assert not store.is_complete()
+    assert store.query([]) == [(3, -91500)]
+
+    store.clear()
+    store.add(ROWS[2:])
+    store.save()
+    assert store.is_complete()
+    assert store.query([]) == [(1, -90000)]
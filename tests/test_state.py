@@ -0,0 +1,60 @@
+from datetime import date
+from parser.transaction import Transaction
+from storage.output import CsvOutput, read_output
+from storage.state import RunState
+
+
+def _transaction(id: str, source_id: str, cents: int, day: int) -> Transaction:
+    return Transaction(id, date(2024, 3, day), 'Transfer', 'EUR', source_id, cents, cents, cents * 6)
+
+
+def _write(state: RunState, path: str, transactions, appending: bool) -> None:
+    rows, earlier_links = state.transfers.link([(t, None) for t in transactions])
+    output = CsvOutput(path, appending)
+    output.write(rows)
+    output.link(earlier_links)
+    output.close()
+    state.fingerprints.add(t for t, _ in rows)
+    state.rollups.add(rows)
+    state.save()
+
+
+def test_failed_full_run_keeps_the_state_of_the_output(tmp_path):
+    state_dir = str(tmp_path / 'state')
+    path = str(tmp_path / 'output.csv')
+    statement = tmp_path / 'statement.csv'
+    statement.write_text('Value Date\n')
+    state = RunState.open(state_dir, appending=False)
+    state.ledger.record('file1', str(statement), 1)
+    _write(state, path, list(state.fingerprints.filter([_transaction('out', 'commerzbank', -12345, 1)])), appending=False)
+    state.close()
+
+    # A --full run clears the state, then stops before it rewrites the output
+    state = RunState.open(state_dir, appending=False)
+    assert list(state.fingerprints.filter([_transaction('x1', 'commerzbank', -12345, 1)])) != []
+    state.close()
+
+    state = RunState.open(state_dir, appending=True)
+    assert state.ledger.contains('file1')
+    assert state.rollups.is_complete()
+    assert state.rollups.query([]) == [(1, -12345)]
+    assert list(state.fingerprints.filter([_transaction('x1', 'commerzbank', -12345, 1)])) == []
+    # The open side of the transfer is still linked by a later export
+    _write(state, path, list(state.fingerprints.filter([_transaction('in', 'n26', 12345, 2)])), appending=True)
+    assert {t.id: t.transfer_id for t, _ in read_output(path)} == {'out': 'in', 'in': 'out'}
+
+
+def test_full_run_replaces_the_state_once_saved(tmp_path):
+    state_dir = str(tmp_path / 'state')
+    path = str(tmp_path / 'output.csv')
+    state = RunState.open(state_dir, appending=False)
+    _write(state, path, [_transaction('a', 'n26', -100, 1)], appending=False)
+    state.close()
+
+    state = RunState.open(state_dir, appending=False)
+    _write(state, path, [_transaction('b', 'n26', -200, 1)], appending=False)
+    state.close()
+
+    state = RunState.open(state_dir, appending=True)
+    assert state.rollups.query([]) == [(1, -200)]
+    assert [t.id for t in state.fingerprints.filter([_transaction('a2', 'n26', -100, 1)])] == ['a2']
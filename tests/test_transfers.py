@@ -0,0 +1,63 @@
+from datetime import date
+from parser.transaction import Transaction
+from storage.transfers import TransferIndex
+
+
+def _row(id: str, source_id: str, cents: int, day: int, currency: str = 'EUR', eur_cents=None):
+    t = Transaction(id, date(2024, 3, day), 'Transfer', currency, source_id,
+                    eur_cents=cents if currency == 'EUR' else eur_cents,
+                    brl_cents=cents if currency == 'BRL' else None)
+    return t, None
+
+
+def test_links_the_two_sides_of_a_transfer(tmp_path):
+    index = TransferIndex.in_state_dir(str(tmp_path))
+    rows, earlier_links = index.link([_row('out', 'commerzbank', -50000, 10), _row('in', 'n26', 50000, 11),
+                                      _row('other', 'n26', 50000, 20)])
+    assert [t.transfer_id for t, _ in rows] == ['in', 'out', None]
+    assert earlier_links == []
+    assert index.linked == 1
+
+
+def test_links_across_currencies_within_the_tolerance(tmp_path):
+    index = TransferIndex.in_state_dir(str(tmp_path))
+    rows, _ = index.link([_row('out', 'commerzbank', -40000, 15), _row('in', 'Banco Inter', 221000, 16, 'BRL', 39833)])
+    assert [t.transfer_id for t, _ in rows] == ['in', 'out']
+
+
+def test_links_with_a_row_of_an_earlier_run(tmp_path):
+    index = TransferIndex.in_state_dir(str(tmp_path))
+    index.link([_row('out', 'commerzbank', -12345, 1)])
+    index.save()
+    index.close()
+
+    index = TransferIndex.in_state_dir(str(tmp_path))
+    rows, earlier_links = index.link([_row('in', 'n26', 12345, 3)])
+    assert [t.transfer_id for t, _ in rows] == ['out']
+    assert earlier_links == [('out', 'in')]
+    index.save()
+
+    # Once linked, the earlier row is not open anymore
+    rows, _ = index.link([_row('again', 'inter', 12345, 2)])
+    assert [t.transfer_id for t, _ in rows] == [None]
+
+
+def test_does_not_link_rows_of_the_same_source_or_too_far_apart(tmp_path):
+    index = TransferIndex.in_state_dir(str(tmp_path), window_days=3)
+    rows, _ = index.link([_row('out', 'n26', -1000, 1), _row('same', 'n26', 1000, 1), _row('late', 'inter', 1000, 10)])
+    assert [t.transfer_id for t, _ in rows] == [None, None, None]
+
+
+def test_clear_only_forgets_the_open_rows_on_save(tmp_path):
+    index = TransferIndex.in_state_dir(str(tmp_path))
+    index.link([_row('out', 'commerzbank', -12345, 1)])
+    index.save()
+
+    index.clear()
+    rows, _ = index.link([_row('in', 'n26', 12345, 2)])
+    assert [t.transfer_id for t, _ in rows] == [None]
+    index.close()
+
+    index = TransferIndex.in_state_dir(str(tmp_path))
+    rows, _ = index.link([_row('in', 'n26', 12345, 2)])
+    assert [t.transfer_id for t, _ in rows] == ['out']